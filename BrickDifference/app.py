@@ -1,9 +1,14 @@
 import os
 import platform
+import time
+import traceback
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from BrickDifference.modelFunctions import *
+from BrickDifference.profiling import Profiler
 
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, QFileSystemWatcher, QTimer
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import (
     QApplication,
@@ -20,7 +25,8 @@ from PyQt6.QtWidgets import (
     QSpinBox,
     QFileDialog,
     QMessageBox,
-    QLabel
+    QLabel,
+    QProgressBar
 )
 from PyQt6.QtCore import pyqtSignal
 
@@ -55,8 +61,27 @@ class MainWindow(QMainWindow):
         self.input_file_a.path_changed.connect(self.path_a_changed)
         input_files_layout.addRow("File A", self.input_file_a)
         self.input_file_b = FileWidget("path/to/second/input/file", line_editable=False)
+        self.input_file_b.path_changed.connect(self.input_changed)
         input_files_layout.addRow("File B", self.input_file_b)
 
+        self.watch_input = QCheckBox()
+        self.watch_input.checkStateChanged.connect(self.watch_changed)
+        watch_label = QLabel("Watch Files ℹ️")
+        watch_label.setToolTip("Generate the difference files again whenever A or B is saved.\n"
+                               "Only the changed submodels are read and compared again.")
+        input_files_layout.addRow(watch_label, self.watch_input)
+        self.file_watcher = QFileSystemWatcher()
+        self.file_watcher.fileChanged.connect(self.watched_file_changed)
+        # Saving often writes a file more than once, the generation starts after a second without changes
+        self.watch_timer = QTimer()
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(1000)
+        self.watch_timer.timeout.connect(self.regenerate_files)
+        # Settings of the watched generation, the session and the files changed since the last generation
+        self.watch_job = None
+        self.session = None
+        self.changed_files = set()
+
     # Output Files Area
         output_files_area = QGroupBox("Output Files")
         output_files_layout = QFormLayout()
@@ -90,7 +115,7 @@ class MainWindow(QMainWindow):
         control_area.setLayout(control_layout)
 
         self.mode_input = QComboBox()
-        self.mode_input.addItems(["Partlist", "Difference Model"])
+        self.mode_input.addItems(["Partlist", "Difference Model", "Flattened Difference Model"])
         self.mode_input.setEditable(False)
         self.mode_input.currentIndexChanged.connect(self.mode_changed)
         self.mode = Mode.PARTLIST
@@ -123,10 +148,30 @@ class MainWindow(QMainWindow):
                              "Distance in LDraw Units (24ldu = 1 brick)")
         control_layout.addRow("Height Distance", self.height_distance_input)
 
+        self.compact_input = QCheckBox()
+        compact_label = QLabel("Compact Partlist ℹ️")
+        compact_label.setToolTip("Place every part type and colour only once in the partlist model.\n"
+                                 "The quantity is written as a comment above each part.")
+        control_layout.addRow(compact_label, self.compact_input)
+
         self.generate_button = QPushButton("Generate Difference Files")
         self.generate_button.clicked.connect(self.generate_files)
         control_layout.addRow(self.generate_button)
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("Idle")
+        control_layout.addRow(self.progress_bar)
+
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setDisabled(True)
+        self.cancel_button.clicked.connect(self.cancel_generation)
+        control_layout.addRow(self.cancel_button)
+
+        self.threadpool = QThreadPool()
+        self.worker = None
+
     # Add Elements to Main Layout
 
         sub_layout.addWidget(input_files_area)
@@ -143,8 +188,15 @@ class MainWindow(QMainWindow):
         self.column_distance_input.setDisabled(partlist_disabled)
         self.row_distance_input.setDisabled(partlist_disabled)
         self.height_distance_input.setDisabled(partlist_disabled)
+        self.compact_input.setDisabled(partlist_disabled)
+        self.input_changed()
+
+    def input_changed(self, path=None):
+        # The watched generation belongs to the previous inputs
+        self.watch_input.setCheckState(Qt.CheckState.Unchecked)
 
     def path_a_changed(self, path):
+        self.input_changed()
         parent_dir = os.path.dirname(path)
         self.output_file_a_and_b.set_default_filename(parent_dir, "BD_in_A_and_B.ldr")
         self.output_file_only_a.set_default_filename(parent_dir, "BD_only_in_A.ldr")
@@ -159,13 +211,20 @@ class MainWindow(QMainWindow):
         generate_only_a = self.output_file_only_a.is_activated
         filepath_only_b = self.output_file_only_b.get_current_path()
         generate_only_b = self.output_file_only_b.is_activated
+        column_distance = self.column_distance_input.value()
+        row_distance = self.row_distance_input.value()
+        height_distance = self.height_distance_input.value()
+        compact = self.compact_input.isChecked()
         if self.mode == Mode.PARTLIST:
-            column_distance = self.column_distance_input.value()
-            row_distance = self.row_distance_input.value()
-            height_distance = self.height_distance_input.value()
+            mode = PARTLIST_MODE
+        elif self.mode == Mode.FLAT_MODEL:
+            mode = FLAT_MODEL_MODE
+        else:
+            mode = DIFF_MODEL_MODE
 
         if not (generate_only_a or generate_only_b or generate_a_and_b):
             QMessageBox.critical(self, "Output Disabled", "All Outputfiles are disabled")
+            self.input_changed()
             return
 
         error_messages = []
@@ -211,6 +270,7 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Filepath Error(s)", f"At least one input file does not exist.\n"
                                                             f"All Errors/Warnings:\n"
                                                             f"{"".join(error_messages)}")
+            self.input_changed()
             return
         elif has_acceptable:
             answer = QMessageBox.warning(
@@ -220,60 +280,226 @@ class MainWindow(QMainWindow):
                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
             )
             if answer == QMessageBox.StandardButton.No:
+                self.input_changed()
                 return
 
-        filetree_a = LdrawFileTree(filepath_a)
-        filetree_b = LdrawFileTree(filepath_b)
-
-        if generate_only_b:
-            if self.mode == Mode.PARTLIST:
-                out_only_b, out_a_and_b = get_part_difference(
-                    list(filetree_b.filetree.values())[0].get_total_partlist(),
-                    list(filetree_a.filetree.values())[0].get_total_partlist()
-                )
-            elif self.mode == Mode.DIFF_MODEL:
-                out_only_b, out_a_and_b = get_difference_model(filetree_b, filetree_a)
-
-        if generate_only_a:
-            if self.mode == Mode.PARTLIST:
-                out_only_a, out_a_and_b = get_part_difference(
-                    list(filetree_a.filetree.values())[0].get_total_partlist(),
-                    list(filetree_b.filetree.values())[0].get_total_partlist()
-                )
-            elif self.mode == Mode.DIFF_MODEL:
-                out_only_a, out_a_and_b = get_difference_model(filetree_a, filetree_b)
-
-        if not generate_only_a and not generate_only_b and generate_a_and_b:
-            if self.mode == Mode.PARTLIST:
-                _, out_a_and_b = get_part_difference(
-                    list(filetree_a.filetree.values())[0].get_total_partlist(),
-                    list(filetree_b.filetree.values())[0].get_total_partlist()
-                )
-            elif self.mode == Mode.DIFF_MODEL:
-                _, out_a_and_b = get_difference_model(filetree_a, filetree_b)
-
-        saved_files = []
-        if self.mode == Mode.PARTLIST:
-            if generate_a_and_b:
-                out_a_and_b.save_as_ldraw_file(filepath_a_and_b, column_distance, row_distance, height_distance)
-                saved_files.append(f"{filepath_a_and_b}\n")
-            if generate_only_a:
-                out_only_a.save_as_ldraw_file(filepath_only_a, column_distance, row_distance, height_distance)
-                saved_files.append(f"{filepath_only_a}\n")
-            if generate_only_b:
-                out_only_b.save_as_ldraw_file(filepath_only_b, column_distance, row_distance, height_distance)
-                saved_files.append(f"{filepath_only_b}\n")
-        elif self.mode == Mode.DIFF_MODEL:
-            if generate_a_and_b:
-                save_model(out_a_and_b, filepath_a_and_b)
-                saved_files.append(f"{filepath_a_and_b}\n")
-            if generate_only_a:
-                save_model(out_only_a, filepath_only_a)
-                saved_files.append(f"{filepath_only_a}\n")
-            if generate_only_b:
-                save_model(out_only_b, filepath_only_b)
-                saved_files.append(f"{filepath_only_b}\n")
-        QMessageBox.information(self, "Files Saved", f"Saved the following files:\n{"".join(saved_files)}")
+        job = (
+            filepath_a, filepath_b, mode,
+            filepath_a_and_b if generate_a_and_b else None,
+            filepath_only_a if generate_only_a else None,
+            filepath_only_b if generate_only_b else None,
+            column_distance, row_distance, height_distance, compact
+        )
+        if self.watch_input.isChecked():
+            self.start_watching(job)
+        self.start_worker(job)
+
+    def start_worker(self, job, changed_files=()):
+        if self.watch_job is not None:
+            self.worker = DifferenceWorker(*job, watch=True, session=self.session, changed_files=changed_files)
+        else:
+            self.worker = DifferenceWorker(*job)
+        self.worker.signals.progress.connect(self.generation_progress)
+        self.worker.signals.finished.connect(self.generation_finished)
+        self.worker.signals.failed.connect(self.generation_failed)
+        self.worker.signals.cancelled.connect(self.generation_cancelled)
+        self.generate_button.setDisabled(True)
+        self.cancel_button.setDisabled(False)
+        self.threadpool.start(self.worker)
+
+    def watch_changed(self, check: Qt.CheckState):
+        if check == Qt.CheckState.Checked:
+            if self.worker is not None:
+                # Can only start watching after the running generation
+                self.input_changed()
+            elif self.watch_job is None:
+                self.generate_files()
+        else:
+            self.stop_watching()
+
+    def start_watching(self, job):
+        self.stop_watching()
+        self.watch_job = job
+        self.file_watcher.addPaths(list(job[:2]))
+
+    def stop_watching(self):
+        self.watch_job = None
+        self.session = None
+        self.changed_files.clear()
+        self.watch_timer.stop()
+        if len(self.file_watcher.files()) > 0:
+            self.file_watcher.removePaths(self.file_watcher.files())
+
+    def watched_file_changed(self, path):
+        self.changed_files.add(path)
+        # Saving by replacing the file ends the watch of that path
+        if path not in self.file_watcher.files() and os.path.exists(path):
+            self.file_watcher.addPath(path)
+        self.watch_timer.start()
+
+    def regenerate_files(self):
+        if self.watch_job is None or len(self.changed_files) == 0:
+            return
+        # Files replaced while they did not exist yet are watched again
+        for path in self.watch_job[:2]:
+            if path not in self.file_watcher.files() and os.path.exists(path):
+                self.file_watcher.addPath(path)
+        if self.worker is not None:
+            # Started again when the current generation is done
+            return
+        changed_files = self.changed_files
+        self.changed_files = set()
+        self.start_worker(self.watch_job, changed_files)
+
+    def cancel_generation(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.cancel_button.setDisabled(True)
+            self.progress_bar.setFormat("Cancelling...")
+
+    def generation_progress(self, percent, message):
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{message} (%p%)")
+
+    def generation_done(self, status):
+        if self.watch_job is not None and self.worker is not None:
+            self.session = self.worker.session
+        self.worker = None
+        self.generate_button.setDisabled(False)
+        self.cancel_button.setDisabled(True)
+        self.progress_bar.setFormat(status)
+        if self.watch_job is not None and len(self.changed_files) > 0 and not self.watch_timer.isActive():
+            self.regenerate_files()
+
+    def generation_finished(self, saved_files, timings):
+        # timings are the lines of Profiler.get_summary, the first one is the total time
+        if self.watch_job is not None:
+            # No message box, the files are regenerated after every save
+            self.generation_done(f"Updated {time.strftime('%H:%M:%S')} ({timings[0]})")
+            return
+        self.generation_done("Done")
+        saved_files = [f"{filepath}\n" for filepath in saved_files]
+        timings = [f"{line}\n" for line in timings]
+        QMessageBox.information(self, "Files Saved", f"Saved the following files:\n{"".join(saved_files)}\n"
+                                                     f"Timings:\n{"".join(timings)}")
+
+    def generation_failed(self, message):
+        if self.watch_job is not None:
+            # Probably read while it was saved, everything is read again after the next change
+            self.worker.session = None
+            self.generation_done(f"Failed, waiting for changes ({message})")
+            return
+        self.generation_done("Failed")
+        QMessageBox.critical(self, "Generation Failed", message)
+
+    def generation_cancelled(self):
+        self.generation_done("Cancelled")
+        self.progress_bar.setValue(0)
+
+
+class WorkerSignals(QObject):
+    progress = pyqtSignal(int, str)
+    finished = pyqtSignal(list, list)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class DifferenceWorker(QRunnable):
+    # Parses, compares and writes outside the GUI thread, parsing counts as the first half of the progress
+    def __init__(self, filepath_a, filepath_b, mode, filepath_a_and_b, filepath_only_a, filepath_only_b,
+                 column_distance, row_distance, height_distance, compact, watch=False, session=None,
+                 changed_files=()):
+        # Watched generations go through a DiffSession (created if None), it only reloads changed_files
+        super().__init__()
+        self.filepath_a = filepath_a
+        self.filepath_b = filepath_b
+        self.mode = mode
+        self.outputs = (filepath_a_and_b, filepath_only_a, filepath_only_b)
+        self.distances = (column_distance, row_distance, height_distance)
+        self.compact = compact
+        self.watch = watch
+        self.session = session
+        self.changed_files = changed_files
+        self.is_cancelled = False
+        # Read part of A and B while both are read, None afterwards
+        self.read_fractions = None
+        self.signals = WorkerSignals()
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def check_cancelled(self):
+        if self.is_cancelled:
+            raise OperationCancelled
+
+    def load_tree(self, side, filepath):
+        progress = partial(self.report_read_progress, side)
+        if self.mode == PARTLIST_MODE:
+            # Only the submodels reachable from the main model are needed
+            filetree = LdrawFileTree(filepath, lazy=True, progress=progress)
+            filetree.total_partlist()
+        else:
+            filetree = LdrawFileTree(filepath, progress=progress)
+        return filetree
+
+    def report_read_progress(self, side, parsed_bytes, total_bytes, file_id):
+        # Called for every parsed file of A (side 0) and B (side 1), also while comparing in a session
+        self.check_cancelled()
+        if self.read_fractions is None:
+            return
+        self.read_fractions[side] = parsed_bytes / total_bytes if total_bytes > 0 else 1
+        self.signals.progress.emit(int(25 * sum(self.read_fractions)), f"Reading {file_id}")
+
+    def report_progress(self, done_steps, total_steps, message):
+        if done_steps < total_steps:
+            self.check_cancelled()
+        self.signals.progress.emit(50 + 50 * done_steps // total_steps, message)
+
+    def run_session(self):
+        if self.session is None:
+            self.signals.progress.emit(0, "Reading A and B")
+            self.session = DiffSession(self.filepath_a, self.filepath_b, progress=self.report_read_progress)
+        else:
+            self.signals.progress.emit(0, "Reading changed files")
+            self.session.set_progress(self.report_read_progress)
+            for side, filepath in enumerate((self.filepath_a, self.filepath_b)):
+                if filepath in self.changed_files:
+                    self.session.load(side)
+        self.check_cancelled()
+        return self.session.generate_difference_files(
+            self.mode, *self.outputs, *self.distances, progress=self.report_progress, compact=self.compact
+        )
+
+    def generate(self):
+        if self.watch:
+            return self.run_session()
+        self.signals.progress.emit(0, "Reading A and B")
+        self.read_fractions = [0, 0]
+        # A and B do not depend on each other, a cancelled side also stops the other one at its next file
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future_a = executor.submit(self.load_tree, 0, self.filepath_a)
+            future_b = executor.submit(self.load_tree, 1, self.filepath_b)
+            filetree_a = future_a.result()
+            filetree_b = future_b.result()
+        self.read_fractions = None
+        self.check_cancelled()
+        return generate_difference_files(
+            filetree_a, filetree_b, self.mode, *self.outputs, *self.distances,
+            progress=self.report_progress, compact=self.compact
+        )
+
+    def run(self):
+        profiler = Profiler()
+        try:
+            with profiler:
+                saved_files = self.generate()
+        except OperationCancelled:
+            self.signals.cancelled.emit()
+        except Exception as error:
+            traceback.print_exc()
+            self.signals.failed.emit(f"{type(error).__name__}: {error}")
+        else:
+            self.signals.finished.emit(saved_files, profiler.get_summary())
 
 
 class FileWidget(QWidget):
@@ -353,6 +579,7 @@ class FileWidget(QWidget):
 class Mode(Enum):
     PARTLIST = 0
     DIFF_MODEL = 1
+    FLAT_MODEL = 2
 def run():
     app = QApplication([0])
     app.setWindowIcon(QIcon(os.path.join(basedir, "icons", "BrickDifference_Icon.ico")))
@@ -0,0 +1,64 @@
+import os
+
+# LDraw colour numbers of the common solid and transparent colours to BrickLink colour ids
+LDRAW_TO_BRICKLINK_COLOURS = {
+    0: 11,  # Black
+    1: 7,  # Blue
+    2: 6,  # Green
+    3: 39,  # Dark Turquoise
+    4: 5,  # Red
+    5: 47,  # Dark Pink
+    6: 8,  # Brown
+    7: 9,  # Light Gray
+    8: 10,  # Dark Gray
+    10: 36,  # Bright Green
+    11: 40,  # Light Turquoise
+    13: 23,  # Pink
+    14: 3,  # Yellow
+    15: 1,  # White
+    19: 2,  # Tan
+    22: 24,  # Purple
+    25: 4,  # Orange
+    26: 71,  # Magenta
+    27: 34,  # Lime
+    28: 69,  # Dark Tan
+    29: 104,  # Bright Pink
+    30: 157,  # Medium Lavender
+    31: 154,  # Lavender
+    33: 14,  # Trans-Dark Blue
+    34: 20,  # Trans-Green
+    36: 17,  # Trans-Red
+    41: 15,  # Trans-Light Blue
+    46: 19,  # Trans-Yellow
+    47: 12,  # Trans-Clear
+    70: 88,  # Reddish Brown
+    71: 86,  # Light Bluish Gray
+    72: 85,  # Dark Bluish Gray
+    73: 42,  # Medium Blue
+    78: 90,  # Light Nougat
+    84: 150,  # Medium Nougat
+    85: 89,  # Dark Purple
+    92: 28,  # Nougat
+    182: 98,  # Trans-Orange
+    191: 110,  # Bright Light Orange
+    212: 105,  # Bright Light Blue
+    226: 103,  # Bright Light Yellow
+    272: 63,  # Dark Blue
+    288: 80,  # Dark Green
+    308: 120,  # Dark Brown
+    320: 59,  # Dark Red
+    321: 153,  # Dark Azure
+    322: 156,  # Medium Azure
+    378: 48,  # Sand Green
+    379: 55  # Sand Blue
+}
+
+
+def get_bricklink_colour(colour_number: int):
+    # None for colours without a known BrickLink id, e.g. the main colour 16 or direct colours
+    return LDRAW_TO_BRICKLINK_COLOURS.get(colour_number)
+
+
+def get_bricklink_part(partname: str) -> str:
+    # Most LDraw parts use the BrickLink id as filename, e.g. 3001.dat and 3069b.dat
+    return os.path.splitext(partname.replace("\\", "/").split("/")[-1])[0]
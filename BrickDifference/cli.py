@@ -0,0 +1,378 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from BrickDifference.modelFunctions import (
+    DiffSession,
+    LdrawFileTree,
+    PartMatrix,
+    generate_difference_files,
+    PARTLIST_FORMATS,
+    PARTLIST_MODE,
+    DIFF_MODEL_MODE,
+    FLAT_MODEL_MODE
+)
+from BrickDifference.library import LDrawLibrary
+from BrickDifference.parsecache import ParseCache
+from BrickDifference.profiling import Profiler
+from BrickDifference.watch import FileWatcher
+
+# Never import PyQt6 (or BrickDifference.app) here, this entry point has to work on headless machines
+
+
+class TreeStore:
+    # Keeps parsed trees by absolute path, so a batch only parses every input once
+    def __init__(self, use_mmap: bool = False, cache: ParseCache = None, library: LDrawLibrary = None):
+        self.use_mmap = use_mmap
+        self.cache = cache
+        self.library = library
+        self.trees = {}
+
+    def get_tree(self, filepath: str) -> LdrawFileTree:
+        filepath = os.path.abspath(filepath)
+        if filepath not in self.trees:
+            self.trees[filepath] = LdrawFileTree(filepath, use_mmap=self.use_mmap, lazy=True, cache=self.cache,
+                                                 library=self.library)
+        return self.trees[filepath]
+
+
+def check_job(filepath_a, filepath_b, outputs: list, overwrite: bool) -> list:
+    errors = []
+    for filepath in (filepath_a, filepath_b):
+        if not os.path.isfile(filepath):
+            errors.append(f"'{filepath}' does not exist")
+    enabled_outputs = [filepath for filepath in outputs if filepath is not None]
+    if len(enabled_outputs) == 0:
+        errors.append("All output files are disabled")
+    for filepath in enabled_outputs:
+        directory = os.path.dirname(os.path.abspath(filepath))
+        if not os.path.isdir(directory):
+            errors.append(f"The directory '{directory}' does not exist")
+        elif os.path.exists(filepath) and not overwrite:
+            errors.append(f"'{filepath}' already exists (use --overwrite)")
+    return errors
+
+
+def run_job(store: TreeStore, mode: str, filepath_a, filepath_b, filepath_a_and_b=None,
+            filepath_only_a=None, filepath_only_b=None, col_distance=165, row_distance=165,
+            height_distance=35, workers=1, overwrite=False, compact=False, tolerance=None,
+            partlist_format=None) -> list:
+    errors = check_job(filepath_a, filepath_b, [filepath_a_and_b, filepath_only_a, filepath_only_b], overwrite)
+    if len(errors) > 0:
+        raise ValueError("\n".join(errors))
+    return generate_difference_files(
+        store.get_tree(filepath_a), store.get_tree(filepath_b), mode,
+        filepath_a_and_b, filepath_only_a, filepath_only_b,
+        col_distance, row_distance, height_distance, workers, compact=compact, tolerance=tolerance,
+        partlist_format=partlist_format
+    )
+
+
+def run_watch(mode: str, filepath_a, filepath_b, filepath_a_and_b=None, filepath_only_a=None,
+              filepath_only_b=None, col_distance=165, row_distance=165, height_distance=35, workers=1,
+              use_mmap=False, overwrite=False, compact=False, debounce=1.0, tolerance=None, library=None,
+              partlist_format=None):
+    # Generates the outputs, then again every time A or B changed until interrupted.
+    # Only the changed files and the files referencing them are read and compared again.
+    outputs = (filepath_a_and_b, filepath_only_a, filepath_only_b)
+    errors = check_job(filepath_a, filepath_b, list(outputs), overwrite)
+    if len(errors) > 0:
+        raise ValueError("\n".join(errors))
+    watcher = FileWatcher([filepath_a, filepath_b], debounce=debounce)
+    session = None
+    changed_files = []
+    while True:
+        try:
+            if session is None:
+                session = DiffSession(filepath_a, filepath_b, use_mmap, library)
+            else:
+                for side, filepath in enumerate((filepath_a, filepath_b)):
+                    if filepath in changed_files:
+                        session.load(side)
+            saved_files = session.generate_difference_files(
+                mode, *outputs, col_distance, row_distance, height_distance, workers, compact=compact,
+                tolerance=tolerance, partlist_format=partlist_format
+            )
+        except (ValueError, KeyError, IndexError, OSError) as error:
+            # Probably saved while writing, everything is read again after the next change
+            session = None
+            print(f"Update failed, waiting for the next change\n{error}", file=sys.stderr)
+        else:
+            print(f"{time.strftime('%H:%M:%S')} saved {', '.join(saved_files)}", flush=True)
+        changed_files = watcher.wait()
+
+
+def run_batch(store: TreeStore, manifest_path: str, workers=1, overwrite=False) -> int:
+    # The manifest is a JSON list of jobs like
+    # {"mode": "partlist", "a": "a.ldr", "b": "b.ldr", "a_and_b": "out.ldr", "only_a": ..., "only_b": ...}
+    # Relative paths are relative to the manifest
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        jobs = json.load(file)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(job, key):
+        if job.get(key) is None:
+            return None
+        return os.path.join(base_dir, job[key])
+
+    failed = 0
+    for index, job in enumerate(jobs):
+        try:
+            saved_files = run_job(
+                store, job.get("mode", PARTLIST_MODE), resolve(job, "a"), resolve(job, "b"),
+                resolve(job, "a_and_b"), resolve(job, "only_a"), resolve(job, "only_b"),
+                job.get("column_distance", 165), job.get("row_distance", 165), job.get("height_distance", 35),
+                workers, overwrite, job.get("compact", False), get_tolerance(
+                    job.get("position_tolerance"), job.get("rotation_tolerance")
+                ), job.get("format")
+            )
+        except (ValueError, KeyError, OSError) as error:
+            failed += 1
+            print(f"Job {index}: failed\n{error}", file=sys.stderr)
+        else:
+            print(f"Job {index}: saved {', '.join(saved_files)}")
+    return 1 if failed > 0 else 0
+
+
+def run_compare(store: TreeStore, filepaths: list, matrix_path=None, intersection_path=None, union_path=None,
+                total_path=None, pairwise_dir=None, overwrite=False, compact=False, pairwise_format="ldr") -> list:
+    errors = [f"'{filepath}' does not exist" for filepath in filepaths if not os.path.isfile(filepath)]
+    names = [os.path.basename(filepath) for filepath in filepaths]
+    outputs = [matrix_path, intersection_path, union_path, total_path]
+    if pairwise_dir is not None:
+        if not os.path.isdir(pairwise_dir):
+            errors.append(f"The directory '{pairwise_dir}' does not exist")
+        else:
+            for name_a in names:
+                for name_b in names:
+                    if name_a != name_b:
+                        filename = get_pairwise_filename(name_a, name_b, pairwise_format)
+                        outputs.append(os.path.join(pairwise_dir, filename))
+    if len(filepaths) < 2:
+        errors.append("At least two input files are needed")
+    if len(set(names)) != len(names):
+        errors.append("The input files need different filenames")
+    if all(filepath is None for filepath in outputs):
+        errors.append("All output files are disabled")
+    for filepath in outputs:
+        if filepath is not None and os.path.exists(filepath) and not overwrite:
+            errors.append(f"'{filepath}' already exists (use --overwrite)")
+    if len(errors) > 0:
+        raise ValueError("\n".join(errors))
+
+    matrix = PartMatrix.from_trees([store.get_tree(filepath) for filepath in filepaths], names)
+    saved_files = []
+    if matrix_path is not None:
+        matrix.save_as_csv(matrix_path)
+        saved_files.append(matrix_path)
+    for filepath, get_partlist in ((intersection_path, matrix.get_intersection), (union_path, matrix.get_union),
+                                   (total_path, matrix.get_total)):
+        if filepath is not None:
+            get_partlist().save_as_file(filepath, compact=compact)
+            saved_files.append(filepath)
+    if pairwise_dir is not None:
+        for (model_a, model_b), partlist in matrix.get_pairwise_differences().items():
+            filename = get_pairwise_filename(names[model_a], names[model_b], pairwise_format)
+            filepath = os.path.join(pairwise_dir, filename)
+            partlist.save_as_file(filepath, pairwise_format, compact=compact)
+            saved_files.append(filepath)
+    return saved_files
+
+
+def get_pairwise_filename(name_a: str, name_b: str, extension: str = "ldr") -> str:
+    return f"BD_{os.path.splitext(name_a)[0]}_not_in_{os.path.splitext(name_b)[0]}.{extension}"
+
+
+def get_tolerance(position_tolerance=None, rotation_tolerance=None):
+    # None (exact matching) unless one of them is given
+    if position_tolerance is None and rotation_tolerance is None:
+        return None
+    tolerance = (position_tolerance or 0.0, rotation_tolerance or 0.0)
+    if min(tolerance) < 0:
+        raise ValueError("Tolerances can not be negative")
+    return tolerance
+
+
+def add_output_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("file_a", help="first input file (A)")
+    parser.add_argument("file_b", help="second input file (B)")
+    parser.add_argument("--a-and-b", dest="a_and_b", metavar="PATH", help="output for everything in A and B")
+    parser.add_argument("--only-a", dest="only_a", metavar="PATH", help="output for everything only in A")
+    parser.add_argument("--only-b", dest="only_b", metavar="PATH", help="output for everything only in B")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and generate the outputs again whenever A or B changes")
+    parser.add_argument("--debounce", type=float, default=1.0, metavar="SECONDS",
+                        help="time without changes before the outputs are generated again (default: 1.0)")
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="brickdifference-cli",
+        description="Calculates the difference between two LDraw files without the graphical userinterface."
+    )
+    parser.add_argument("--overwrite", action="store_true", help="replace existing output files")
+    parser.add_argument("--mmap", action="store_true", help="memory-map the input files")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used for the difference model (default: 1)")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="keep parsed models in this directory, unchanged inputs are not parsed again")
+    parser.add_argument("--cache-size", type=int, default=512, metavar="MB",
+                        help="size limit of the cache directory, least recently used models are removed (default: 512)")
+    parser.add_argument("--library", metavar="DIR",
+                        help="LDraw library (with parts, p and models) for referenced files that are not in the model")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write the time spent parsing, totaling, comparing and writing as JSON ('-' for stdout)")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also trace the peak memory of the profiled run (much slower)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    partlist_parser = subparsers.add_parser(PARTLIST_MODE, help="compare the partlists of A and B")
+    add_output_arguments(partlist_parser)
+    partlist_parser.add_argument("--column-distance", type=int, default=165,
+                                 help="distance between part types in LDraw units (default: 165)")
+    partlist_parser.add_argument("--row-distance", type=int, default=165,
+                                 help="distance between part colours in LDraw units (default: 165)")
+    partlist_parser.add_argument("--height-distance", type=int, default=35,
+                                 help="height between parts of the same type and colour (default: 35)")
+    partlist_parser.add_argument("--compact", action="store_true",
+                                 help="write every part type and colour once with its quantity as a comment")
+    partlist_parser.add_argument("--format", choices=PARTLIST_FORMATS,
+                                 help="write the partlists as LDraw model, CSV, JSON or BrickLink wanted list XML "
+                                      "(default: by file extension, LDraw for unknown ones)")
+
+    model_parser = subparsers.add_parser(DIFF_MODEL_MODE, help="compare the geometry of A and B")
+    flat_parser = subparsers.add_parser(FLAT_MODEL_MODE,
+                                        help="compare the geometry of A and B with all submodels resolved")
+    for geometry_parser in (model_parser, flat_parser):
+        add_output_arguments(geometry_parser)
+        geometry_parser.add_argument("--position-tolerance", type=float, metavar="LDU",
+                                     help="match parts of the same type and colour that are at most this far apart")
+        geometry_parser.add_argument("--rotation-tolerance", type=float, metavar="DELTA",
+                                     help="match parts whose rotation matrix entries differ at most by this much")
+
+    compare_parser = subparsers.add_parser("compare", help="compare the partlists of many models at once")
+    compare_parser.add_argument("files", nargs="+", help="input files")
+    compare_parser.add_argument("--matrix", metavar="PATH", help="CSV with the count of every part in every model")
+    compare_parser.add_argument("--intersection", metavar="PATH", help="partlist model of the parts all models have")
+    compare_parser.add_argument("--union", metavar="PATH",
+                                help="partlist model with enough parts to build any one of the models")
+    compare_parser.add_argument("--total", metavar="PATH", help="partlist model with the parts of all models summed")
+    compare_parser.add_argument("--pairwise", metavar="DIR",
+                                help="directory for a partlist model of the missing parts of every pair")
+    compare_parser.add_argument("--compact", action="store_true",
+                                help="write every part type and colour once with its quantity as a comment")
+    compare_parser.add_argument("--pairwise-format", choices=PARTLIST_FORMATS, default="ldr",
+                                help="format of the pairwise partlists (default: ldr), the other outputs "
+                                     "use their file extension")
+
+    batch_parser = subparsers.add_parser("batch", help="run many comparisons listed in a JSON manifest")
+    batch_parser.add_argument("manifest", help="JSON file with a list of jobs")
+
+    serve_parser = subparsers.add_parser("serve", help="keep parsed models in memory and answer difference requests "
+                                                       "over HTTP until stopped")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve_parser.add_argument("--socket", metavar="PATH", help="listen on this Unix socket instead of a port")
+    serve_parser.add_argument("--max-trees", type=int, default=16,
+                              help="parsed models kept in memory, least recently used ones are dropped (default: 16)")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = get_parser().parse_args(argv)
+    if args.profile is None:
+        return run_command(args)
+    with Profiler(args.profile_memory) as profiler:
+        exit_code = run_command(args)
+    report = profiler.get_report()
+    report["command"] = args.command
+    report["exit_code"] = exit_code
+    try:
+        write_profile(report, args.profile)
+    except OSError as error:
+        print(error, file=sys.stderr)
+        return 1
+    return exit_code
+
+
+def write_profile(report: dict, filepath: str):
+    if filepath == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    with open(filepath, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+
+def run_command(args: argparse.Namespace) -> int:
+    cache = None
+    library = None
+    try:
+        if args.cache_dir is not None:
+            cache = ParseCache(args.cache_dir, args.cache_size << 20)
+        if args.library is not None:
+            # The index is kept with the cache if there is one, the library itself is never written to
+            index_path = None if args.cache_dir is None else os.path.join(args.cache_dir, "library_index.json")
+            library = LDrawLibrary(args.library, index_path)
+    except (ValueError, OSError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    if args.command == "serve":
+        # Imported here, the service imports this module
+        from BrickDifference.service import run_service
+        try:
+            run_service(args.host, args.port, args.socket, args.max_trees, args.workers, args.overwrite, library)
+        except (ValueError, OSError) as error:
+            print(error, file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            pass
+        return 0
+    store = TreeStore(args.mmap, cache, library)
+    if args.command == "batch":
+        return run_batch(store, args.manifest, args.workers, args.overwrite)
+
+    distances = (165, 165, 35)
+    compact = False
+    tolerance = None
+    partlist_format = None
+    if args.command in (PARTLIST_MODE, "compare"):
+        compact = args.compact
+    if args.command == PARTLIST_MODE:
+        distances = (args.column_distance, args.row_distance, args.height_distance)
+        partlist_format = args.format
+    try:
+        if args.command in (DIFF_MODEL_MODE, FLAT_MODEL_MODE):
+            tolerance = get_tolerance(args.position_tolerance, args.rotation_tolerance)
+        if args.command == "compare":
+            saved_files = run_compare(store, args.files, args.matrix, args.intersection, args.union, args.total,
+                                      args.pairwise, args.overwrite, compact, args.pairwise_format)
+        elif args.watch:
+            run_watch(args.command, args.file_a, args.file_b, args.a_and_b, args.only_a, args.only_b, *distances,
+                      args.workers, args.mmap, args.overwrite, compact, args.debounce, tolerance, library,
+                      partlist_format)
+        else:
+            saved_files = run_job(store, args.command, args.file_a, args.file_b,
+                                  args.a_and_b, args.only_a, args.only_b, *distances,
+                                  workers=args.workers, overwrite=args.overwrite, compact=compact,
+                                  tolerance=tolerance, partlist_format=partlist_format)
+    except (ValueError, KeyError, OSError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        # Ends the watch mode
+        return 0
+    print("Saved the following files:")
+    for filepath in saved_files:
+        print(filepath)
+    return 0
+
+
+def run():
+    sys.exit(main())
+
+
+if __name__ == "__main__":
+    run()
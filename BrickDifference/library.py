@@ -0,0 +1,182 @@
+import json
+import os
+from collections import OrderedDict
+from threading import RLock
+
+from BrickDifference.modelFunctions import LdrawFileTree
+from BrickDifference.profiling import get_profiler
+from BrickDifference.watch import get_file_signature
+
+# Searched in this order, a name found in an earlier directory hides the same name in later ones.
+# Only directories with models, parts (.dat) are never loaded from the library.
+SEARCH_DIRECTORIES = ["models"]
+# Increase whenever the index format changes
+INDEX_VERSION = 1
+
+
+def get_reference_key(reference: str) -> str:
+    # References are case insensitive and may use either kind of slash
+    return reference.lower().replace("/", "\\")
+
+
+def find_directory(base: str, relative: str):
+    # Case insensitive lookup of a directory below base, None if it does not exist
+    directory = base
+    for name in relative.split("/"):
+        try:
+            entries = {entry.name.lower(): entry.name for entry in os.scandir(directory) if entry.is_dir()}
+        except OSError:
+            return None
+        if name not in entries:
+            return None
+        directory = os.path.join(directory, entries[name])
+    return directory
+
+
+class LDrawLibrary:
+    # Resolves references to files that are not part of a model from a local LDraw library (like the LDRAWDIR).
+    # The names of all files are indexed once and stored in index_path (only kept in memory if None),
+    # the index is built again when one of the indexed directories changed.
+    # Loaded files are shared by every tree using the library, the files of at most max_files
+    # of them are kept. Parts (.dat) are never loaded, they stay parts in partlists.
+    def __init__(self, directory: str, index_path: str = None, max_files: int = 256):
+        if not os.path.isdir(directory):
+            raise ValueError(f"The LDraw library '{directory}' does not exist")
+        if max_files < 1:
+            raise ValueError("The library has to keep at least one file")
+        self.directory = directory
+        self.index_path = index_path
+        self.max_files = max_files
+        # Reference key to the path relative to the library
+        self.files = {}
+        # Modification times of all indexed directories, None for search directories that do not exist
+        self.directories = {}
+        # (path, reference) to (file signature, files) of the loaded files, least recently used first
+        self.loaded = OrderedDict()
+        self.loaded_count = 0
+        self.loading = set()
+        # Trees of A and B may be loaded at the same time
+        self.lock = RLock()
+        if not self.load_index():
+            self.build_index()
+
+    def load_index(self) -> bool:
+        # True if the stored index exists and is still up to date
+        if self.index_path is None:
+            return False
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if index.get("version") != INDEX_VERSION or index.get("search_directories") != SEARCH_DIRECTORIES:
+            return False
+        for relative, mtime in index["directories"].items():
+            if self.get_directory_mtime(relative) != mtime:
+                return False
+        self.files = index["files"]
+        self.directories = index["directories"]
+        return True
+
+    def get_directory_mtime(self, relative: str):
+        try:
+            return os.stat(os.path.join(self.directory, relative)).st_mtime_ns
+        except OSError:
+            return None
+
+    def build_index(self):
+        self.files = {}
+        self.directories = {}
+        for search_directory in SEARCH_DIRECTORIES:
+            root = find_directory(self.directory, search_directory)
+            if root is None:
+                # Checked again next time, in case it was created
+                self.directories[search_directory] = None
+                continue
+            for directory, _, filenames in os.walk(root):
+                relative = os.path.relpath(directory, self.directory)
+                self.directories[relative] = os.stat(directory).st_mtime_ns
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    key = get_reference_key(os.path.relpath(path, root).replace(os.sep, "/"))
+                    self.files.setdefault(key, os.path.relpath(path, self.directory))
+        index = {
+            "version": INDEX_VERSION,
+            "search_directories": SEARCH_DIRECTORIES,
+            "directories": self.directories,
+            "files": self.files
+        }
+        if self.index_path is None:
+            return
+        try:
+            temporary_path = f"{self.index_path}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(index, file)
+            os.replace(temporary_path, self.index_path)
+        except OSError:
+            # A read-only cache directory works as well, the index is only built again next time
+            pass
+
+    def find(self, reference: str, directory: str = None):
+        # Path of the referenced file, the directory of the referencing model is searched first
+        if directory is not None:
+            path = os.path.join(directory, reference.replace("\\", os.sep))
+            if os.path.isfile(path):
+                return path
+        relative = self.files.get(get_reference_key(reference))
+        if relative is None:
+            return None
+        return os.path.join(self.directory, relative)
+
+    def load(self, reference: str, directory: str = None):
+        # Returns the referenced file as dict of file ids to LDrawFile objects, the first one is the referenced
+        # file with the lowercase reference as id, followed by its submodels and the library files they reference.
+        # None if the file does not exist. Nothing returned may be modified.
+        path = self.find(reference, directory)
+        if path is None:
+            return None
+        signature = get_file_signature(path)
+        key = (path, reference)
+        profiler = get_profiler()
+        with self.lock:
+            if key in self.loaded and self.loaded[key][0] == signature:
+                self.loaded.move_to_end(key)
+                profiler.count("library_hits")
+                return self.loaded[key][1]
+            if path in self.loading:
+                raise ValueError(f"'{reference}' references itself")
+            self.loading.add(path)
+            try:
+                tree = LdrawFileTree(path, library=self)
+            finally:
+                self.loading.remove(path)
+            profiler.count("library_loads")
+            files = OrderedDict()
+            main_file = tree.filetree[tree.main_id]
+            # Plain .ldr files have no FILE line and the name in an .mpd does not have to match the reference
+            main_file.filename = reference
+            if len(main_file.header) > 0 and main_file.header[0].startswith("0 FILE"):
+                main_file.header[0] = f"0 FILE {reference}\n"
+            else:
+                main_file.header.insert(0, f"0 FILE {reference}\n")
+            files[reference.lower()] = main_file
+            for file_id, ld_file in tree.filetree.items():
+                if file_id != tree.main_id:
+                    files.setdefault(file_id, ld_file)
+            self.add_loaded(key, signature, files)
+        return files
+
+    def add_loaded(self, key: tuple, signature, files: dict):
+        if key in self.loaded:
+            self.loaded_count -= len(self.loaded.pop(key)[1])
+        self.loaded[key] = (signature, files)
+        self.loaded_count += len(files)
+        # The newest entry is kept even if it is larger than max_files
+        while self.loaded_count > self.max_files and len(self.loaded) > 1:
+            _, (_, old_files) = self.loaded.popitem(last=False)
+            self.loaded_count -= len(old_files)
+
+    def clear(self):
+        with self.lock:
+            self.loaded.clear()
+            self.loaded_count = 0
@@ -1,19 +1,104 @@
-import time
 import os
+import io
+import csv
+import json
+import sys
+import mmap
+import re
+import operator
+from array import array
+from collections import Counter
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache, partial
+from hashlib import blake2b
+from itertools import product, repeat
+from math import floor
+from xml.sax.saxutils import escape
+
+from BrickDifference.bricklink import get_bricklink_colour, get_bricklink_part
+from BrickDifference.parsecache import get_content_hash
+from BrickDifference.profiling import get_profiler
+
+FINGERPRINT_BITS = 128
+# Increase whenever parsed files or totals change, so old parse cache entries are no longer used
+PARSER_VERSION = 3
+PARTLIST_MODE = "partlist"
+# Partlist file formats, see Partlist.save_as_file
+LDRAW_FORMAT = "ldr"
+CSV_FORMAT = "csv"
+JSON_FORMAT = "json"
+BRICKLINK_FORMAT = "xml"
+PARTLIST_FORMATS = [LDRAW_FORMAT, CSV_FORMAT, JSON_FORMAT, BRICKLINK_FORMAT]
+DIFF_MODEL_MODE = "model"
+FLAT_MODEL_MODE = "flat"
+# Outputs of a comparison
+ONLY_A = 0
+ONLY_B = 1
+A_AND_B = 2
+# Composed transforms are rounded, so the same placement reached through different submodels compares equal
+FLAT_DIGITS = 6
+MAIN_COLOUR = "16"
+PART_NUMBER_PATTERN = re.compile(r"\d+")
+# Reference of a type-1 line, like parse_placement reads it
+REFERENCE_PATTERN = re.compile(rb"^1[ \t]+(?:\S+[ \t]+){13}([^\r\n]*?)[ \t]*\r?$", re.MULTILINE)
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_part_id(part_id: str) -> tuple:
+    # "colour:name" -> (colour number, part number, colour, name), the numbers are -1 if there is none.
+    # The part number is the first group of digits in the name, e.g. 3069 for 3069b.dat
+    colour, _, partname = part_id.partition(":")
+    colour_number = int(colour) if colour.isdigit() else -1
+    digits = PART_NUMBER_PATTERN.search(partname.split(".dat")[0])
+    part_number = int(digits.group()) if digits is not None else -1
+    return colour_number, part_number, colour, partname
+
+
+class OperationCancelled(Exception):
+    pass
+
+
+class PartVocabulary:
+    # Dense indices for the part ids of a fixed group of partlists, only built for the arithmetic between them
+    def __init__(self, partlists: list):
+        self.part_ids = list(dict.fromkeys(part_id for partlist in partlists for part_id in partlist.partlist))
+        self.indices = {part_id: index for index, part_id in enumerate(self.part_ids)}
+
+    def get_counts(self, partlist) -> array:
+        counts = array("q", bytes(8 * len(self.part_ids)))
+        indices = self.indices
+        for part_id, amount in partlist.partlist.items():
+            counts[indices[part_id]] = amount
+        return counts
+
+    def get_partlist(self, counts):
+        return Partlist.from_dict({part_id: amount for part_id, amount in zip(self.part_ids, counts) if amount != 0})
 
 
 class Partlist:
+    # self.partlist maps part ids ("colour:name") to counts, parts with a count of 0 are left out.
+    # Comparing more than two partlists at once runs over count vectors instead, see PartMatrix.
     def __init__(self, partlist: dict = None):
+        self.partlist = {}
         if partlist is not None:
-            self.partlist = partlist
-        else:
-            self.partlist = {}
+            for part_id, amount in partlist.items():
+                self.add_part(part_id, amount)
+
+    @classmethod
+    def from_dict(cls, partlist: dict):
+        # Takes over partlist, which must not contain counts of 0
+        new_partlist = cls()
+        new_partlist.partlist = partlist
+        return new_partlist
 
     def add_part(self, p_id: str, amount: int = 1):
-        if p_id in self.partlist:
-            self.partlist[p_id] += amount
-        else:
+        amount += self.partlist.get(p_id, 0)
+        if amount != 0:
             self.partlist[p_id] = amount
+        else:
+            self.partlist.pop(p_id, None)
 
     def add_part_by_line(self, line: str):
         parameters = line.strip("\n").split(" ")
@@ -21,83 +106,135 @@ class Partlist:
         name = " ".join(parameters[14:])
         self.add_part(f"{colour}:{name}")
 
+    def add_partlist(self, other, factor: int = 1):
+        if factor == 0:
+            return
+        partlist = self.partlist
+        for part_id, amount in other.partlist.items():
+            partlist[part_id] = partlist.get(part_id, 0) + amount * factor
+
+    def get_common(self, other):
+        # Element-wise minimum, the parts both partlists have
+        other_partlist = other.partlist
+        return Partlist.from_dict({part_id: min(amount, other_partlist[part_id])
+                                   for part_id, amount in self.partlist.items() if part_id in other_partlist})
+
+    def get_difference(self, other):
+        # Element-wise difference clipped at 0, the parts only this partlist has
+        other_partlist = other.partlist
+        return Partlist.from_dict({part_id: amount - other_partlist.get(part_id, 0)
+                                   for part_id, amount in self.partlist.items()
+                                   if amount > other_partlist.get(part_id, 0)})
+
+    def copy(self):
+        return Partlist.from_dict(self.partlist.copy())
+
+    def get_part_key(self, part_id: str) -> tuple:
+        # Parsed once per part id: (colour number, part number, colour, part name)
+        return parse_part_id(part_id)
+
     def get_total_part_count(self) -> int:
-        count = 0
-        for part in self.partlist:
-            count += self.partlist[part]
-        return count
-
-    def generate_ldraw_model(self, filename, col_distance=165, row_distance=165, height_distance=35):
-        header = [
-            f"0 FILE {filename}\n",
-            "0 Untitled Model\n",
-            f"0 Name:  {filename}\n",
-            "0 Author: \n",
-            "0 CustomBrick\n",
-            "0 FlexibleBrickControlPointUnitLength -1\n",
-            f"0 NumOfBricks:  {self.get_total_part_count()}\n"
-        ]
-        content = []
-        rows = {}
-        columns = {}
-        part_ids = list(self.partlist.keys())
-
-        def part_id_to_partnumber(part_id: str):
-            name = part_id.split(":")[1].split(".dat")[0]
-            digits = []
-            post_chars = False
-            for char in name:
-                if not char.isdigit() and post_chars:
-                    break
-                if char.isdigit():
-                    post_chars = True
-                    digits.append(char)
-            if len(digits) > 0:
-                return int("".join(digits))
-            else:
-                return -1
+        return sum(self.partlist.values())
+
+    def generate_ldraw_model(self, filename, col_distance=165, row_distance=165, height_distance=35,
+                             compact=False):
+        return list(self.iter_ldraw_lines(filename, col_distance, row_distance, height_distance, compact))
 
-        col_count = 0
-        part_ids.sort(key=part_id_to_partnumber)
-        for part_id in part_ids:
-            partname = part_id.split(":")[1]
+    def iter_ldraw_lines(self, filename, col_distance=165, row_distance=165, height_distance=35, compact=False):
+        # compact writes one part per colour and type, preceded by a comment with its quantity
+        if compact:
+            brick_count = len(self.partlist)
+        else:
+            brick_count = self.get_total_part_count()
+        yield f"0 FILE {filename}\n"
+        yield "0 Untitled Model\n"
+        yield f"0 Name:  {filename}\n"
+        yield "0 Author: \n"
+        yield "0 CustomBrick\n"
+        yield "0 FlexibleBrickControlPointUnitLength -1\n"
+        yield f"0 NumOfBricks:  {brick_count}\n"
+        part_keys = {part_id: self.get_part_key(part_id) for part_id in self.partlist}
+        # Columns are ordered by part number and rows by colour number, ties keep the order of appearance
+        columns = {}
+        colour_numbers = {}
+        for part_id in sorted(part_keys, key=lambda key: part_keys[key][1]):
+            colour_number, _, colour, partname = part_keys[part_id]
             if partname not in columns:
-                columns[partname] = col_count
-                col_count += 1
+                columns[partname] = len(columns)
+            if colour not in colour_numbers:
+                colour_numbers[colour] = colour_number
+        rows = {colour: row for row, colour in enumerate(sorted(colour_numbers, key=colour_numbers.get))}
 
-        def colour_id_to_number(part_colour: str):
-            colour_id = part_colour.split(":")[0]
-            if colour_id.isdigit():
-                return int(colour_id)
-            else:
-                return -1
-
-        row_count = 0
-        part_ids.sort(key=colour_id_to_number)
-        for part_id in part_ids:
-            colour = part_id.split(":")[0]
-            if colour not in rows:
-                rows[colour] = row_count
-                row_count += 1
-
-        for part in self.partlist:
-            colour, partname = part.split(":")
-            column = columns[partname]
-            row = rows[colour]
-            for i in range(self.partlist[part]):
-                new_line = f"1 {colour} {column * col_distance} {-i * height_distance} {row * row_distance} 1 0 0 0 1 0 0 0 1 {partname}\n"
-                content.append(new_line)
-
-        return header + content + ["0 NOFILE\n"]
-
-    def save_as_ldraw_file(self, filepath, col_distance=165, row_distance=165, height_distance=35):
+        for part, amount in self.partlist.items():
+            _, _, colour, partname = part_keys[part]
+            x = columns[partname] * col_distance
+            z = rows[colour] * row_distance
+            if compact:
+                yield f"0 // Quantity: {amount}\n"
+                yield f"1 {colour} {x} 0 {z} 1 0 0 0 1 0 0 0 1 {partname}\n"
+                continue
+            for i in range(amount):
+                yield f"1 {colour} {x} {-i * height_distance} {z} 1 0 0 0 1 0 0 0 1 {partname}\n"
+
+        yield "0 NOFILE\n"
+
+    def save_as_ldraw_file(self, filepath, col_distance=165, row_distance=165, height_distance=35, compact=False):
         filename = os.path.basename(filepath)
-        lines = self.generate_ldraw_model(filename, col_distance, row_distance, height_distance)
-        with open(filepath, "w", encoding="utf-8") as file:
-            file.writelines(lines)
+        with get_profiler().phase("write"), open(filepath, "w", encoding="utf-8") as file:
+            file.writelines(self.iter_ldraw_lines(filename, col_distance, row_distance, height_distance, compact))
+
+    def iter_rows(self):
+        # (colour, part name, amount) of every part, ordered by part number, part name and colour number
+        part_keys = {part_id: parse_part_id(part_id) for part_id in self.partlist}
+        for part_id in sorted(part_keys, key=lambda key: (part_keys[key][1], part_keys[key][3], part_keys[key][0])):
+            _, _, colour, partname = part_keys[part_id]
+            yield colour, partname, self.partlist[part_id]
+
+    def iter_json_lines(self):
+        # A list of objects, one per line
+        separator = "\n"
+        yield "["
+        for colour, partname, amount in self.iter_rows():
+            yield separator + json.dumps({"colour": colour, "part": partname, "quantity": amount})
+            separator = ",\n"
+        yield "\n]\n"
+
+    def iter_bricklink_lines(self):
+        # BrickLink wanted list, parts without a known BrickLink colour get their LDraw colour as remark
+        yield "<INVENTORY>\n"
+        for colour, partname, amount in self.iter_rows():
+            yield "  <ITEM>\n    <ITEMTYPE>P</ITEMTYPE>\n"
+            yield f"    <ITEMID>{escape(get_bricklink_part(partname))}</ITEMID>\n"
+            bricklink_colour = get_bricklink_colour(int(colour)) if colour.isdigit() else None
+            if bricklink_colour is not None:
+                yield f"    <COLOR>{bricklink_colour}</COLOR>\n"
+            else:
+                yield f"    <REMARKS>LDraw colour {escape(colour)}</REMARKS>\n"
+            yield f"    <MINQTY>{amount}</MINQTY>\n  </ITEM>\n"
+        yield "</INVENTORY>\n"
+
+    def save_as_file(self, filepath, file_format: str = None, col_distance=165, row_distance=165,
+                     height_distance=35, compact=False):
+        # file_format is one of PARTLIST_FORMATS, by default it is taken from the file extension (LDraw if unknown)
+        if file_format is None:
+            file_format = get_partlist_format(filepath)
+        if file_format == LDRAW_FORMAT:
+            self.save_as_ldraw_file(filepath, col_distance, row_distance, height_distance, compact)
+            return
+        if file_format not in PARTLIST_FORMATS:
+            raise ValueError(f"Unknown partlist format '{file_format}'")
+        with get_profiler().phase("write"), open(filepath, "w", encoding="utf-8", newline="") as file:
+            if file_format == CSV_FORMAT:
+                writer = csv.writer(file)
+                writer.writerow(["colour", "part", "quantity"])
+                writer.writerows(self.iter_rows())
+            elif file_format == JSON_FORMAT:
+                file.writelines(self.iter_json_lines())
+            else:
+                file.writelines(self.iter_bricklink_lines())
 
     def __str__(self):
-        return str(self.partlist)
+        return str(self.partlist.copy())
 
     def __repr__(self):
         return f"Parlist -> Unique:{len(self.partlist)}, Total: {self.get_total_part_count()}"
@@ -105,167 +242,1366 @@ class Partlist:
     def __add__(self, other):
         if not isinstance(other, Partlist):
             raise ValueError
-        sum_list = Partlist(other.partlist.copy())
-        for part in self.partlist:
-            sum_list.add_part(part, self.partlist[part])
-        return sum_list
+        total = self.copy()
+        total.add_partlist(other)
+        return total
 
     def __mul__(self, other):
-        prod_list = Partlist(self.partlist.copy())
         if not isinstance(other, int):
             raise ValueError
-        for part in prod_list.partlist:
-            prod_list.partlist[part] *= other
-        return prod_list
+        if other == 0:
+            return Partlist()
+        return Partlist.from_dict({part_id: amount * other for part_id, amount in self.partlist.items()})
+
+
+class PlacementList:
+    # Stores type-1 lines column wise, a placement is the tuple (colour, transform, reference).
+    # The transform is kept as written in the file (texts), the 12 numbers are only converted into one flat
+    # array of doubles once something needs them. Computed transforms have None as text, as long as
+    # the numbers are not converted every text is set.
+    __slots__ = ("colours", "texts", "references", "converted")
+
+    def __init__(self, placements=None):
+        self.colours = []
+        self.texts = []
+        self.references = []
+        self.converted = None
+        if placements is not None:
+            self.extend(placements)
+
+    @property
+    def transforms(self) -> array:
+        if self.converted is None:
+            try:
+                self.converted = array("d", map(float, " ".join(self.texts).split()))
+            except ValueError:
+                raise ValueError(f"Invalid type-1 line: {self.find_invalid_line()}") from None
+        return self.converted
+
+    def find_invalid_line(self) -> str:
+        for colour, text, reference in zip(self.colours, self.texts, self.references):
+            try:
+                array("d", map(float, text.split()))
+            except ValueError:
+                return f"1 {colour} {text} {reference}"
+        return ""
+
+    def add_text(self, colour: str, text: str, reference: str):
+        # text holds the 12 transform numbers separated by whitespace
+        self.colours.append(colour)
+        self.texts.append(text)
+        self.references.append(reference)
+        if self.converted is not None:
+            self.converted.extend(map(float, text.split()))
+
+    def append(self, placement: tuple):
+        colour, transform, reference = placement
+        self.colours.append(colour)
+        self.transforms.extend(transform)
+        self.texts.append(None)
+        self.references.append(reference)
+
+    def append_from(self, other, index: int):
+        # Copies a placement of other, keeping its text
+        text = other.texts[index]
+        if text is None or self.converted is not None:
+            self.transforms.extend(other.transforms[index * 12:index * 12 + 12])
+        self.colours.append(other.colours[index])
+        self.texts.append(text)
+        self.references.append(other.references[index])
+
+    def extend(self, placements):
+        if isinstance(placements, PlacementList):
+            if placements.converted is not None or self.converted is not None:
+                self.transforms.extend(placements.transforms)
+            self.colours.extend(placements.colours)
+            self.texts.extend(placements.texts)
+            self.references.extend(placements.references)
+        else:
+            for placement in placements:
+                self.append(placement)
+
+    def copy(self):
+        return PlacementList(self)
+
+    def sort(self, key=None):
+        placements = self.copy()
+        order = sorted(range(len(placements)), key=lambda index: placements[index] if key is None
+                       else key(placements[index]))
+        self.__init__()
+        for index in order:
+            self.append_from(placements, index)
+
+    def get_transform(self, index: int) -> tuple:
+        return tuple(self.transforms[index * 12:index * 12 + 12])
+
+    def get_lines(self):
+        for index, text in enumerate(self.texts):
+            if text is None:
+                text = " ".join(map(format_number, self.get_transform(index)))
+            yield f"1 {self.colours[index]} {text} {self.references[index]}\n"
+
+    def __len__(self):
+        return len(self.colours)
+
+    def __getitem__(self, index: int) -> tuple:
+        if index < 0:
+            index += len(self.colours)
+        return self.colours[index], self.get_transform(index), self.references[index]
+
+    def __iter__(self):
+        transforms = self.transforms
+        for index, colour in enumerate(self.colours):
+            yield colour, tuple(transforms[index * 12:index * 12 + 12]), self.references[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, PlacementList):
+            return NotImplemented
+        return (self.colours == other.colours
+                and self.references == other.references
+                and (self.texts == other.texts or self.transforms == other.transforms))
+
+    def __getstate__(self):
+        # Converted numbers are left out if the texts are complete
+        converted = self.converted if None in self.texts else None
+        return self.colours, self.texts, self.references, converted
+
+    def __setstate__(self, state):
+        self.colours, self.texts, self.references, self.converted = state
 
 
 class LDrawFile:
-    def __init__(self, content: list):
+    def __init__(self, content: list = ()):
         self.header = []
-        self.filename = content[0].strip("\n")[7:]
-        self.modelname = content[1].strip("\n")[2:]
+        self.filename = ""
+        self.modelname = ""
         self.parts = Partlist()
         self.submodels = {}
-        self.content = []
-        header_complete = False
+        self.content = PlacementList()
+        # Order independent hash of the content lines, the sum of the hashes of all lines
+        # Of the placements, only computed when a comparison needs it
+        self.content_fingerprint = None
+        # Also covers the content of all linked submodels, set by LdrawFileTree
+        self.deep_fingerprint = None
+        # Called with a submodel id to load submodels that are not linked yet
+        self.resolver = None
+        self.header_complete = False
         for line in content:
-            if line.startswith("1"):
-                header_complete = True
-            if line.startswith("0 NumOfBricks"):
-                pass
-            elif not header_complete:
-                self.header.append(line)
-            elif line.startswith("1"):
-                self.content.append(line)
-                if line.endswith(".dat\n"):
-                    self.parts.add_part_by_line(line)
-                else:
-                    submodel_id = " ".join(line.strip("\n").split(" ")[14:])
-                    if submodel_id in self.submodels:
-                        self.submodels[submodel_id][1] += 1
-                    else:
-                        self.submodels[submodel_id] = [None, 1]
+            self.add_line(line)
+
+    def add_line(self, line: str):
+        if line.startswith("1"):
+            self.header_complete = True
+            self.add_placement(*parse_placement(line))
+        elif line.startswith("0 NumOfBricks"):
+            pass
+        elif not self.header_complete:
+            if len(self.header) == 0:
+                self.filename = line.strip("\n")[7:]
+            elif len(self.header) == 1:
+                self.modelname = line.strip("\n")[2:]
+            self.header.append(line)
+
+    def add_placement(self, colour: str, text: str, reference: str):
+        # text holds the transform as written, see PlacementList
+        self.content.add_text(colour, text, reference)
+        if reference.endswith(".dat"):
+            self.parts.add_part(f"{colour}:{reference}")
+            return
+        # References are case insensitive, submodels are known by their lowercase file id
+        sub_id = reference.lower()
+        if sub_id in self.submodels:
+            self.submodels[sub_id][1] += 1
+        else:
+            self.submodels[sub_id] = [None, 1]
 
     def link_submodel(self, submodel):
         sub_id = submodel.filename.lower()
         self.submodels[sub_id][0] = submodel
 
-    def get_total_partlist(self) -> Partlist:
-        total_list = Partlist(self.parts.partlist.copy())
+    def get_submodel(self, sub_id: str):
+        submodel = self.submodels[sub_id][0]
+        if submodel is None and self.resolver is not None:
+            submodel = self.resolver(sub_id)
+            self.link_submodel(submodel)
+        return submodel
+
+    def get_total_partlist(self, cache: dict = None) -> Partlist:
+        # cache maps lowercase file ids to finished totals, so shared submodels are only totaled once
+        if cache is None:
+            cache = {}
+        file_id = self.filename.lower()
+        if file_id in cache:
+            return cache[file_id]
+        total_list = self.parts.copy()
         for sub_id in self.submodels:
-            total_list += self.submodels[sub_id][0].get_total_partlist() * self.submodels[sub_id][1]
+            if sub_id in cache:
+                sub_total = cache[sub_id]
+            else:
+                sub_total = self.get_submodel(sub_id).get_total_partlist(cache)
+            total_list.add_partlist(sub_total, self.submodels[sub_id][1])
+        cache[file_id] = total_list
         return total_list
 
+    @property
+    def fingerprint(self) -> int:
+        # Sum of the hashes of all type-1 lines, so it does not depend on their order
+        if self.content_fingerprint is None:
+            self.content_fingerprint = sum(map(get_line_hash, self.content.get_lines())) % (1 << FINGERPRINT_BITS)
+        return self.content_fingerprint
+
+    def update_deep_fingerprint(self):
+        # All linked submodels need a deep fingerprint already
+        digest = blake2b(f"{self.fingerprint:x}".encode(), digest_size=FINGERPRINT_BITS // 8)
+        for sub_id in sorted(self.submodels):
+            digest.update(f"|{sub_id}:{self.get_submodel(sub_id).deep_fingerprint:x}".encode())
+        self.deep_fingerprint = int.from_bytes(digest.digest(), "little")
+
     def get_ldraw_lines(self):
-        return self.header + self.content + ["0 NOFILE\n"]
+        return list(self.iter_ldraw_lines())
+
+    def iter_ldraw_lines(self):
+        yield from self.header
+        yield from self.content.get_lines()
+        yield "0 NOFILE\n"
+
+    def __getstate__(self):
+        # Submodel links and the resolver belong to a tree, LdrawFileTree links the files again
+        state = self.__dict__.copy()
+        state["submodels"] = {sub_id: [None, count] for sub_id, (_, count) in self.submodels.items()}
+        state["resolver"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
 
     def __eq__(self, other):
         if not isinstance(other, LDrawFile):
             raise ValueError
-        self.content.sort()
-        other.content.sort()
-        if self.filename != other.filename:
-            return False
-        if len(self.content) != len(other.content):
-            return False
-        for index, line in enumerate(self.content):
-            if line != other.content[index]:
-                return False
-        return True
+        return (self.filename == other.filename
+                and len(self.content) == len(other.content)
+                and self.fingerprint == other.fingerprint)
+
+
+class LazyFileTree(Mapping):
+    # Maps file ids to LDrawFile objects like a dict, but only parses a file on first access
+    def __init__(self, file_ids, load_file):
+        self.files = dict.fromkeys(file_ids)
+        self.load_file = load_file
+
+    def is_loaded(self, file_id: str) -> bool:
+        return self.files[file_id] is not None
+
+    def __getitem__(self, file_id: str):
+        ld_file = self.files[file_id]
+        if ld_file is None:
+            ld_file = self.load_file(file_id)
+            self.files[file_id] = ld_file
+        return ld_file
+
+    def __contains__(self, file_id):
+        return file_id in self.files
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
 
 
 class LdrawFileTree:
-    def __init__(self, filepath: str):
-        self.filetree = {}
-        with open(filepath, "r", encoding="utf-8") as file:
-            submodel_content = []
-            ends_with_nofile = False
-            for line in file:
-                submodel_content.append(line)
-                if line.startswith("0 NOFILE"):
-                    ends_with_nofile = True
-                    if len(submodel_content) > 0:
-                        submodel = LDrawFile(submodel_content)
+    def __init__(self, filepath: str, use_mmap: bool = False, lazy: bool = False, cache=None, library=None,
+                 progress=None):
+        # cache is an optional parsecache.ParseCache, a tree loaded from it is always fully parsed.
+        # library is an optional library.LDrawLibrary, referenced files that are not part of the file are loaded
+        # from it. Trees using a library are not cached, since the library files can change.
+        # progress(parsed_bytes, total_bytes, file id) is called after every file that was read and before
+        # every lazily parsed file, it may raise OperationCancelled. It can be replaced later on.
+        self.filepath = filepath
+        self.progress = progress
+        self.parsed_bytes = 0
+        self.line_count = 0
+        self.total_partlists = {}
+        # Parts of a file with their position in the coordinates of that file, see get_flat_content
+        self.flat_contents = {}
+        self.parents = None
+        # Memory map of the file in the memory-mapped mode, lazily parsed files are read again from the file otherwise
+        self.buffer = None
+        # (modification time, size) of the file when the blocks were indexed
+        self.file_signature = None
+        self.blocks = {}
+        self.parsed_count = 0
+        self.from_cache = False
+        # Files loaded from the library, they are shared with other trees and never written to difference models
+        self.external_ids = set()
+        if library is not None:
+            cache = None
+        profiler = get_profiler()
+        with profiler.phase("parse"):
+            cache_key = None
+            if cache is not None:
+                cache_key = f"v{PARSER_VERSION}_{get_content_hash(filepath)}"
+                state = cache.get(cache_key)
+                if state is not None:
+                    profiler.count("cache_hits")
+                    self.set_cache_state(state)
+                    return
+                profiler.count("cache_misses")
+            if use_mmap or lazy:
+                # Only the file boundaries are searched now, files are decoded and parsed when first reached.
+                # The content is not kept, so files that are never reached do not take any memory.
+                with open(filepath, "rb") as file:
+                    stat = os.fstat(file.fileno())
+                    self.file_signature = (stat.st_mtime_ns, stat.st_size)
+                    if use_mmap and stat.st_size > 0:
+                        self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                        content = self.buffer
+                    else:
+                        content = file.read()
+                self.blocks = index_blocks(content)
+                self.filetree = LazyFileTree(self.blocks, self.load_block)
+                if library is not None:
+                    references = (match.decode("utf-8") for match in REFERENCE_PATTERN.findall(content))
+                    self.add_external_files(library, references)
+                del content
+            else:
+                self.filetree = {}
+                with open(filepath, "r", encoding="utf-8") as file:
+                    # Every line is handed to its submodel right away, only the parsed placements are kept
+                    total_bytes = os.fstat(file.fileno()).st_size
+                    submodel = LDrawFile()
+                    ends_with_nofile = False
+                    for line in file:
+                        self.line_count += 1
+                        submodel.add_line(line)
+                        if line.startswith("0 NOFILE"):
+                            ends_with_nofile = True
+                            self.filetree[submodel.filename.lower()] = submodel
+                            if progress is not None:
+                                # Ahead by at most one read chunk
+                                self.parsed_bytes = file.buffer.tell()
+                                progress(self.parsed_bytes, total_bytes, submodel.filename.lower())
+                            submodel = LDrawFile()
+                    if not ends_with_nofile:
                         self.filetree[submodel.filename.lower()] = submodel
-                        submodel_content = []
-            if not ends_with_nofile:
-                submodel = LDrawFile(submodel_content)
-                self.filetree[submodel.filename.lower()] = submodel
-        for fileid in self.filetree:
-            file: LDrawFile = self.filetree[fileid]
-            for submodel in file.submodels:
-                file.link_submodel(self.filetree[submodel])
-
-
-def get_difference_model(model_a: LdrawFileTree, model_b: LdrawFileTree):
-    difference_model = {}
-    common_model = {}
-    for file_id in model_a.filetree:
-        diff_file = LDrawFile(model_a.filetree[file_id].header)
-        comm_file = LDrawFile(model_a.filetree[file_id].header)
-        if file_id in model_b.filetree:
-            file_a = model_a.filetree[file_id]
-            file_b = model_b.filetree[file_id]
-            for line in file_a.content:
-                if line in file_b.content:
-                    if not line.endswith(".dat\n"):
-                        sub_id = " ".join(line.strip("\n").split(" ")[14:])
-                        if model_a.filetree[sub_id] != model_b.filetree[sub_id]:
-                            diff_file.content.append(line)
-                    comm_file.content.append(line)
+                self.parsed_count = len(self.filetree)
+                if library is not None:
+                    self.add_external_files(library, [reference for ld_file in list(self.filetree.values())
+                                                      for reference in ld_file.content.references])
+                for fileid in self.filetree:
+                    if fileid in self.external_ids:
+                        continue
+                    file: LDrawFile = self.filetree[fileid]
+                    for submodel in file.submodels:
+                        file.link_submodel(self.filetree[submodel])
+                profiler.count("lines_parsed", self.line_count)
+                profiler.count("submodels_parsed", self.parsed_count)
+            self.main_id = next(iter(self.filetree))
+            if cache is not None:
+                cache.put(cache_key, self.get_cache_state())
+
+    def add_external_files(self, library, references):
+        # Adds the library files of the references that are no part of the file, with the files they reference
+        files = self.filetree.files if isinstance(self.filetree, LazyFileTree) else self.filetree
+        directory = os.path.dirname(os.path.abspath(self.filepath))
+        for reference in dict.fromkeys(references):
+            if reference.lower() in files or reference.endswith(".dat"):
+                continue
+            external_files = library.load(reference, directory)
+            if external_files is None:
+                raise ValueError(f"'{reference}' is neither part of '{self.filepath}' nor of the LDraw library")
+            for file_id, ld_file in external_files.items():
+                if file_id not in files:
+                    files[file_id] = ld_file
+                    self.external_ids.add(file_id)
+                elif files[file_id] is not ld_file:
+                    raise ValueError(f"The library file '{reference}' contains '{file_id}', "
+                                     f"which is also part of '{self.filepath}'")
+
+    def get_cache_state(self) -> dict:
+        # Parses everything left and computes all fingerprints and totals, so a cached tree needs no more work
+        for file_id in self.get_topological_order():
+            self.get_deep_fingerprint(file_id)
+            self.total_partlist(file_id)
+        return {
+            "files": dict(self.filetree.items()),
+            "main_id": self.main_id,
+            "line_count": self.line_count,
+            "total_partlists": self.total_partlists
+        }
+
+    def set_cache_state(self, state: dict):
+        self.filetree = state["files"]
+        self.main_id = state["main_id"]
+        self.line_count = state["line_count"]
+        self.total_partlists = state["total_partlists"]
+        for ld_file in self.filetree.values():
+            for sub_id in ld_file.submodels:
+                if sub_id in self.filetree:
+                    ld_file.link_submodel(self.filetree[sub_id])
+        self.from_cache = True
+
+    def load_block(self, file_id: str) -> LDrawFile:
+        # Parses one indexed file, its submodels are only loaded once something asks for them
+        start, end = self.blocks[file_id]
+        if self.progress is not None:
+            self.progress(self.parsed_bytes, self.file_signature[1], file_id)
+        self.parsed_bytes += end - start
+        ld_file = LDrawFile()
+        line_count = 0
+        profiler = get_profiler()
+        with profiler.phase("parse"):
+            for line in decode_lines(self.read_content(start, end)):
+                line_count += 1
+                ld_file.add_line(line)
+        self.line_count += line_count
+        profiler.count("lines_parsed", line_count)
+        profiler.count("submodels_parsed")
+        ld_file.resolver = self.filetree.__getitem__
+        self.parsed_count += 1
+        if self.parsed_count == len(self.blocks):
+            self.close()
+        return ld_file
+
+    def get_load_statistics(self) -> dict:
+        if isinstance(self.filetree, LazyFileTree):
+            unparsed = [file_id for file_id in self.filetree if not self.filetree.is_loaded(file_id)]
+        else:
+            unparsed = []
+        return {
+            "files": len(self.filetree),
+            "parsed": len(self.filetree) - len(unparsed),
+            "unparsed": len(unparsed),
+            "unparsed_ids": unparsed,
+            "lines": self.line_count,
+            "external": len(self.external_ids),
+            "from_cache": self.from_cache
+        }
+
+    def get_deep_fingerprint(self, file_id: str) -> int:
+        if self.filetree[file_id].deep_fingerprint is None:
+            for current_id in self.get_topological_order(file_id):
+                if self.filetree[current_id].deep_fingerprint is None:
+                    self.filetree[current_id].update_deep_fingerprint()
+        return self.filetree[file_id].deep_fingerprint
+
+    def read_content(self, start: int = 0, end: int = None) -> bytes:
+        # Bytes of the indexed file, they must not have changed since the blocks were indexed
+        if end is None:
+            end = self.file_signature[1]
+        if self.buffer is not None:
+            return self.buffer[start:end]
+        with open(self.filepath, "rb") as file:
+            stat = os.fstat(file.fileno())
+            if (stat.st_mtime_ns, stat.st_size) != self.file_signature:
+                raise ValueError(f"'{self.filepath}' changed while it was read, it has to be loaded again")
+            file.seek(start)
+            return file.read(end - start)
+
+    def get_block_digests(self) -> dict:
+        return get_block_digests(self.buffer if self.buffer is not None else self.read_content(), self.blocks)
+
+    def close(self):
+        # Releases the memory map, files not parsed yet are read from the file again
+        if self.buffer is not None:
+            self.buffer.close()
+        self.buffer = None
+
+    def get_topological_order(self, file_id: str = None) -> list:
+        # Submodels always come before the files referencing them
+        if file_id is None:
+            file_ids = list(self.filetree)
+        else:
+            file_ids = [file_id]
+        order = []
+        finished = set()
+        in_progress = set()
+        for root_id in file_ids:
+            if root_id in finished:
+                continue
+            stack = [(root_id, iter(self.filetree[root_id].submodels))]
+            in_progress.add(root_id)
+            while stack:
+                current_id, children = stack[-1]
+                for child_id in children:
+                    if child_id in in_progress:
+                        raise ValueError(f"Submodel '{child_id}' is part of a reference cycle")
+                    if child_id not in finished:
+                        in_progress.add(child_id)
+                        stack.append((child_id, iter(self.filetree[child_id].submodels)))
+                        break
                 else:
-                    if line.endswith(".dat\n"):
-                        diff_file.content.append(line)
-                    else:
-                        sub_id = " ".join(line.strip("\n").split(" ")[14:])
-                        if sub_id not in model_b.filetree:
-                            diff_file.content.append(line)
+                    stack.pop()
+                    in_progress.remove(current_id)
+                    finished.add(current_id)
+                    order.append(current_id)
+        return order
+
+    def total_partlist(self, file_id: str = None) -> Partlist:
+        # The returned Partlist is cached and shared, it must not be modified
+        if file_id is None:
+            file_id = self.main_id
+        if file_id not in self.total_partlists:
+            profiler = get_profiler()
+            with profiler.phase("totals"):
+                for current_id in self.get_topological_order(file_id):
+                    if current_id not in self.total_partlists:
+                        self.filetree[current_id].get_total_partlist(self.total_partlists)
+                        profiler.count("submodels_totaled")
+        return self.total_partlists[file_id]
+
+    def get_flat_content(self, file_id: str = None) -> PlacementList:
+        # Every part placed by file_id and its submodels with the transform composed along the references.
+        # Every file is only expanded once, each use of it only transforms its cached expansion.
+        # The returned PlacementList is cached and shared, it must not be modified.
+        if file_id is None:
+            file_id = self.main_id
+        if file_id not in self.flat_contents:
+            profiler = get_profiler()
+            with profiler.phase("flatten"):
+                for current_id in self.get_topological_order(file_id):
+                    if current_id in self.flat_contents:
+                        continue
+                    flat_content = PlacementList()
+                    for colour, transform, reference in self.filetree[current_id].content:
+                        sub_id = reference.lower()
+                        if sub_id in self.filetree and not reference.endswith(".dat"):
+                            compose_placements(colour, transform, self.flat_contents[sub_id], flat_content)
                         else:
-                            new_sub_header = model_a.filetree[sub_id].header.copy()
-                            time_id = hex(time.time_ns())[2:]
-                            new_sub_id = f"{model_a.filetree[sub_id].filename.lower()}_{time_id}"
-                            #Case ID already used in model
-                            while new_sub_id in model_a.filetree:
-                                time_id = hex(time.time_ns())[2:]
-                                new_sub_id = f"{model_a.filetree[sub_id].filename.lower()}_{time_id}"
-
-                            new_sub_header[0] = new_sub_header[0].replace("\n", f"_{time_id}\n")
-                            new_sub_header[1] = new_sub_header[1].replace("\n", f"_{time_id}\n")
-                            new_sub_header[2] = new_sub_header[2].replace("\n", f"_{time_id}\n")
-                            new_sub = LDrawFile(new_sub_header+model_a.filetree[sub_id].content)
-                            difference_model[new_sub_id] = new_sub
-                            new_line = line.replace("\n", f"_{time_id}\n")
-                            diff_file.content.append(new_line)
-            common_model[file_id] = comm_file
-            if len(diff_file.content) > 0:
-                difference_model[file_id] = diff_file
+                            rounded = tuple(round(value, FLAT_DIGITS) + 0.0 for value in transform)
+                            flat_content.append((colour, rounded, reference))
+                    self.flat_contents[current_id] = flat_content
+                    profiler.count("submodels_flattened")
+        return self.flat_contents[file_id]
+
+    def get_parents(self) -> dict:
+        if self.parents is None:
+            self.parents = {file_id: set() for file_id in self.filetree}
+            for file_id, ld_file in self.filetree.items():
+                for sub_id in ld_file.submodels:
+                    # Also covers referenced files that do not exist
+                    self.parents.setdefault(sub_id, set()).add(file_id)
+        return self.parents
+
+    def get_ancestors(self, file_ids) -> set:
+        # file_ids and every file that (indirectly) references one of them
+        parents = self.get_parents()
+        ancestors = set()
+        stack = list(file_ids)
+        while stack:
+            current_id = stack.pop()
+            if current_id not in ancestors:
+                ancestors.add(current_id)
+                stack.extend(parents.get(current_id, ()))
+        return ancestors
+
+    def invalidate_total_partlists(self, file_id: str = None):
+        # Drops the cached totals of file_id and every file that (indirectly) references it
+        if file_id is None:
+            self.total_partlists.clear()
+            return
+        for current_id in self.get_ancestors([file_id]):
+            self.total_partlists.pop(current_id, None)
+
+    def reuse_files(self, old_tree, block_digests: dict, old_block_digests: dict) -> set:
+        # Takes over the parsed files of old_tree (an earlier lazy load of the same path) whose bytes did not change,
+        # with their fingerprints and totals as long as nothing below them changed. old_tree can not be used anymore.
+        # Returns the ids of the changed, added and removed files.
+        changed_ids = set(old_tree.filetree) - set(self.filetree)
+        for file_id in self.filetree:
+            if file_id in self.external_ids:
+                # Only changed if the library loaded it again
+                if old_tree.filetree.files.get(file_id) is not self.filetree.files[file_id]:
+                    changed_ids.add(file_id)
+            elif old_block_digests.get(file_id) != block_digests[file_id]:
+                changed_ids.add(file_id)
+            elif old_tree.filetree.is_loaded(file_id):
+                ld_file = old_tree.filetree[file_id]
+                for entry in ld_file.submodels.values():
+                    entry[0] = None
+                ld_file.resolver = self.filetree.__getitem__
+                self.filetree.files[file_id] = ld_file
+                self.parsed_count += 1
+        old_tree.close()
+        if self.parsed_count == len(self.blocks):
+            self.close()
+        affected_ids = self.get_ancestors(changed_ids)
+        for file_id in affected_ids - self.external_ids:
+            if file_id in self.filetree and self.filetree.is_loaded(file_id):
+                self.filetree[file_id].deep_fingerprint = None
+        self.total_partlists = {file_id: total for file_id, total in old_tree.total_partlists.items()
+                                if file_id in self.filetree and file_id not in affected_ids}
+        self.flat_contents = {file_id: flat_content for file_id, flat_content in old_tree.flat_contents.items()
+                              if file_id in self.filetree and file_id not in affected_ids}
+        return changed_ids
+
+
+def parse_placement(line: str) -> tuple:
+    # "1 <colour> x y z a b c d e f g h i <reference>" -> (colour, "x y z a b c d e f g h i", reference),
+    # the reference may contain spaces. The numbers are only converted by PlacementList when needed.
+    parameters = line.split(None, 14)
+    if len(parameters) < 15:
+        raise ValueError(f"Invalid type-1 line: {line.rstrip()}")
+    return sys.intern(parameters[1]), " ".join(parameters[2:14]), sys.intern(parameters[14].rstrip())
+
+
+def format_number(value: float) -> str:
+    if value.is_integer():
+        return str(int(value))
+    text = repr(value)
+    if "e" in text:
+        text = f"{value:.12f}".rstrip("0").rstrip(".")
+    return text
+
+
+def compose_placements(colour: str, transform: tuple, placements: PlacementList, target: PlacementList):
+    # Appends placements as seen through a reference line with colour and transform to target,
+    # parts in the main colour take the colour of the reference
+    x, y, z, a, b, c, d, e, f, g, h, i = transform
+    source = placements.transforms
+    composed = []
+    if (a, b, c, d, e, f, g, h, i) == (1, 0, 0, 0, 1, 0, 0, 0, 1):
+        # Only moved, the rotations stay the same
+        for start in range(0, len(source), 12):
+            composed.append(source[start] + x)
+            composed.append(source[start + 1] + y)
+            composed.append(source[start + 2] + z)
+            composed.extend(source[start + 3:start + 12])
+    else:
+        for start in range(0, len(source), 12):
+            p_x, p_y, p_z, r_a, r_b, r_c, r_d, r_e, r_f, r_g, r_h, r_i = source[start:start + 12]
+            composed.extend((
+                a * p_x + b * p_y + c * p_z + x, d * p_x + e * p_y + f * p_z + y, g * p_x + h * p_y + i * p_z + z,
+                a * r_a + b * r_d + c * r_g, a * r_b + b * r_e + c * r_h, a * r_c + b * r_f + c * r_i,
+                d * r_a + e * r_d + f * r_g, d * r_b + e * r_e + f * r_h, d * r_c + e * r_f + f * r_i,
+                g * r_a + h * r_d + i * r_g, g * r_b + h * r_e + i * r_h, g * r_c + h * r_f + i * r_i
+            ))
+    # Adding 0.0 turns -0.0 into 0.0
+    target.transforms.extend([round(value, FLAT_DIGITS) + 0.0 for value in composed])
+    target.texts.extend(repeat(None, len(placements)))
+    if colour == MAIN_COLOUR:
+        target.colours.extend(placements.colours)
+    else:
+        target.colours.extend([colour if part_colour == MAIN_COLOUR else part_colour
+                               for part_colour in placements.colours])
+    target.references.extend(placements.references)
+
+
+def get_line_hash(line: str) -> int:
+    # Over the transform as written, numbers written differently only make the files compare again
+    digest = blake2b(line.encode(), digest_size=FINGERPRINT_BITS // 8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def get_unmatched_indices(content_a: PlacementList, content_b: PlacementList):
+    # Indices of the placements without an identical partner, with the same pairing as compare_placements
+    b_placements = Counter(content_b)
+    unmatched_a = []
+    for index, placement in enumerate(content_a):
+        if b_placements[placement] > 0:
+            b_placements[placement] -= 1
+        else:
+            unmatched_a.append(index)
+    unmatched_b = []
+    for index, placement in enumerate(content_b):
+        if b_placements[placement] > 0:
+            b_placements[placement] -= 1
+            unmatched_b.append(index)
+    return unmatched_a, unmatched_b
+
+
+def match_within_tolerance(content_a: PlacementList, indices_a: list, content_b: PlacementList, indices_b: list,
+                           tolerance: tuple):
+    # Pairs placements of the same colour and part whose positions are at most tolerance[0] LDU apart
+    # and whose rotation matrix entries differ by at most tolerance[1], each placement of A takes the nearest
+    # free one of B. B is put into a grid of cells as large as the position tolerance, so only the
+    # 27 cells around a placement of A have to be searched. Returns the paired indices of A and B.
+    position_tolerance, rotation_tolerance = tolerance
+    max_distance = position_tolerance * position_tolerance
+    cell_size = position_tolerance if position_tolerance > 0 else 1.0
+    transforms_a = content_a.transforms
+    transforms_b = content_b.transforms
+    grid = {}
+    for index in indices_b:
+        x, y, z = transforms_b[index * 12:index * 12 + 3]
+        key = (content_b.colours[index], content_b.references[index],
+               floor(x / cell_size), floor(y / cell_size), floor(z / cell_size))
+        grid.setdefault(key, []).append(index)
+    matched_a = set()
+    matched_b = set()
+    for index_a in indices_a:
+        transform_a = transforms_a[index_a * 12:index_a * 12 + 12]
+        colour = content_a.colours[index_a]
+        reference = content_a.references[index_a]
+        x, y, z = transform_a[:3]
+        cell_x, cell_y, cell_z = floor(x / cell_size), floor(y / cell_size), floor(z / cell_size)
+        best_index = None
+        best_distance = 0.0
+        for offset_x, offset_y, offset_z in product((-1, 0, 1), repeat=3):
+            key = (colour, reference, cell_x + offset_x, cell_y + offset_y, cell_z + offset_z)
+            for index_b in grid.get(key, ()):
+                if index_b in matched_b:
+                    continue
+                transform_b = transforms_b[index_b * 12:index_b * 12 + 12]
+                distance = (x - transform_b[0]) ** 2 + (y - transform_b[1]) ** 2 + (z - transform_b[2]) ** 2
+                if distance > max_distance:
+                    continue
+                if any(abs(a - b) > rotation_tolerance for a, b in zip(transform_a[3:], transform_b[3:])):
+                    continue
+                if best_index is None or (distance, index_b) < (best_distance, best_index):
+                    best_index = index_b
+                    best_distance = distance
+        if best_index is not None:
+            matched_a.add(index_a)
+            matched_b.add(best_index)
+    return matched_a, matched_b
+
+
+def compare_placements(content_a: PlacementList, content_b: PlacementList, changed_subs: set,
+                       missing_subs_a: set, missing_subs_b: set = None, tolerance: tuple = None):
+    # Matches the placements of one file of A and B. changed_subs holds the ids of submodels that differ
+    # between A and B, missing_subs_a/b the ids only referenced by A/B that do not exist in the other model.
+    # The differences of B are only collected if missing_subs_b is given.
+    # With a tolerance (position in LDU, rotation matrix entries) placements left without an identical
+    # partner are also matched to nearby ones, see match_within_tolerance.
+    # Module level, so it can run in a process pool.
+    diff_a, renamed_a = PlacementList(), []
+    diff_b, renamed_b = None, None
+    comm_content = PlacementList()
+    near_a = near_b = ()
+    if tolerance is not None:
+        unmatched_a, unmatched_b = get_unmatched_indices(content_a, content_b)
+        near_a, near_b = match_within_tolerance(content_a, unmatched_a, content_b, unmatched_b, tolerance)
+    # Remaining occurrences of each placement in B, so duplicates are only matched once each
+    b_placements = Counter(content_b)
+    for index, placement in enumerate(content_a):
+        reference = placement[2]
+        sub_id = reference.lower()
+        matched = b_placements[placement] > 0
+        if matched:
+            b_placements[placement] -= 1
+        if matched or index in near_a:
+            if sub_id in changed_subs:
+                diff_a.append_from(content_a, index)
+            comm_content.append_from(content_a, index)
+        else:
+            if not reference.endswith(".dat") and sub_id not in missing_subs_a:
+                # Moved submodel that also exists in B, it gets a renamed copy in the difference model
+                renamed_a.append(len(diff_a))
+            diff_a.append_from(content_a, index)
+    if missing_subs_b is not None:
+        diff_b, renamed_b = PlacementList(), []
+        # What is left in b_placements are the placements of B without a match
+        for index, placement in enumerate(content_b):
+            reference = placement[2]
+            sub_id = reference.lower()
+            unmatched = b_placements[placement] > 0
+            if unmatched:
+                b_placements[placement] -= 1
+            if unmatched and index not in near_b:
+                if not reference.endswith(".dat") and sub_id not in missing_subs_b:
+                    renamed_b.append(len(diff_b))
+                diff_b.append_from(content_b, index)
+            elif sub_id in changed_subs:
+                diff_b.append_from(content_b, index)
+    return diff_a, renamed_a, comm_content, diff_b, renamed_b
+
+
+def compare_files(model_a: LdrawFileTree, model_b: LdrawFileTree, symmetric: bool = False, workers: int = 1,
+                  previous: dict = None, outdated_ids: set = (), tolerance: tuple = None, lazy: bool = False):
+    # Runs compare_placements for every file in A and B whose subtree is not identical in both.
+    # Results from previous (same symmetric setting) are reused for files not in outdated_ids.
+    # lazy only compares a file once its result is accessed (without tolerance and extra workers).
+    with get_profiler().phase("compare"):
+        if tolerance is not None:
+            return compare_files_within_tolerance(model_a, model_b, workers, tolerance)
+        return compare_files_exactly(model_a, model_b, symmetric, workers, previous, outdated_ids, lazy)
+
+
+def compare_files_exactly(model_a: LdrawFileTree, model_b: LdrawFileTree, symmetric: bool, workers: int,
+                          previous: dict, outdated_ids: set, lazy: bool):
+    compared_ids = []
+    comparisons = []
+    reused = {}
+    for file_id in model_a.filetree:
+        if file_id not in model_b.filetree:
+            continue
+        file_a = model_a.filetree[file_id]
+        file_b = model_b.filetree[file_id]
+        if (file_a.filename == file_b.filename
+                and model_a.get_deep_fingerprint(file_id) == model_b.get_deep_fingerprint(file_id)):
+            continue
+        if previous is not None and file_id in previous and file_id not in outdated_ids:
+            reused[file_id] = previous[file_id]
+            continue
+        changed_subs = set()
+        missing_subs_a = set()
+        missing_subs_b = set() if symmetric else None
+        for ld_file, model, other, missing_subs in ((file_a, model_a, model_b, missing_subs_a),
+                                                     (file_b, model_b, model_a, missing_subs_b)):
+            if missing_subs is None:
+                continue
+            for sub_id in ld_file.submodels:
+                if sub_id not in other.filetree:
+                    missing_subs.add(sub_id)
+                elif sub_id in model.filetree and model_a.filetree[sub_id] != model_b.filetree[sub_id]:
+                    changed_subs.add(sub_id)
+        compared_ids.append(file_id)
+        comparisons.append((file_a.content, file_b.content, changed_subs, missing_subs_a, missing_subs_b))
+
+    get_profiler().count("results_reused", len(reused))
+    if lazy and workers <= 1:
+        return LazyComparisonResults(reused, dict(zip(compared_ids, comparisons)))
+    reused.update(zip(compared_ids, run_comparisons(comparisons, workers)))
+    return reused
+
+
+class LazyComparisonResults(MutableMapping):
+    # compare_files results that are computed when they are first accessed
+    def __init__(self, results: dict, comparisons: dict):
+        self.results = results
+        # Arguments of compare_placements for every result not computed yet
+        self.comparisons = comparisons
+
+    def __getitem__(self, file_id: str) -> tuple:
+        if file_id not in self.results:
+            profiler = get_profiler()
+            with profiler.phase("compare"):
+                self.results[file_id] = compare_placements(*self.comparisons.pop(file_id))
+            profiler.count("submodels_compared")
+        return self.results[file_id]
+
+    def __setitem__(self, file_id: str, result: tuple):
+        self.comparisons.pop(file_id, None)
+        self.results[file_id] = result
+
+    def __delitem__(self, file_id: str):
+        if file_id in self.comparisons:
+            del self.comparisons[file_id]
+        else:
+            del self.results[file_id]
+
+    def __contains__(self, file_id):
+        return file_id in self.results or file_id in self.comparisons
+
+    def __iter__(self):
+        yield from self.results
+        yield from self.comparisons
+
+    def __len__(self):
+        return len(self.results) + len(self.comparisons)
+
+
+def run_comparisons(comparisons: list, workers: int = 1) -> list:
+    # comparisons holds the arguments of compare_placements calls
+    get_profiler().count("submodels_compared", len(comparisons))
+    if workers > 1 and len(comparisons) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(comparisons) // (workers * 4))
+            return list(executor.map(compare_placements, *zip(*comparisons), chunksize=chunksize))
+    return [compare_placements(*comparison) for comparison in comparisons]
+
+
+def compare_files_within_tolerance(model_a: LdrawFileTree, model_b: LdrawFileTree, workers: int, tolerance: tuple):
+    # Fingerprints can not tell whether a submodel only changed within the tolerance, so every file pair is compared
+    # without changed submodels first. Files using submodels with placements left without a partner
+    # are compared again afterwards.
+    compared_ids = []
+    comparisons = []
+    for file_id in model_a.filetree:
+        if file_id not in model_b.filetree:
+            continue
+        if (model_a.filetree[file_id].filename == model_b.filetree[file_id].filename
+                and model_a.get_deep_fingerprint(file_id) == model_b.get_deep_fingerprint(file_id)):
+            continue
+        missing_subs = []
+        for ld_file, other in ((model_a.filetree[file_id], model_b), (model_b.filetree[file_id], model_a)):
+            missing_subs.append({sub_id for sub_id in ld_file.submodels if sub_id not in other.filetree})
+        compared_ids.append(file_id)
+        comparisons.append([model_a.filetree[file_id].content, model_b.filetree[file_id].content, set(),
+                            *missing_subs, tolerance])
+    results = dict(zip(compared_ids, run_comparisons(comparisons, workers)))
+
+    changed_ids = {file_id for file_id, (diff_a, _, _, diff_b, _) in results.items()
+                   if len(diff_a) > 0 or len(diff_b) > 0}
+    recompared_ids = []
+    recomparisons = []
+    for file_id, comparison in zip(compared_ids, comparisons):
+        sub_ids = model_a.filetree[file_id].submodels.keys() | model_b.filetree[file_id].submodels.keys()
+        changed_subs = sub_ids & changed_ids
+        if len(changed_subs) > 0:
+            comparison[2] = changed_subs
+            recompared_ids.append(file_id)
+            recomparisons.append(comparison)
+    results.update(zip(recompared_ids, run_comparisons(recomparisons, workers)))
+    return results
+
+
+def iter_difference_file(model: LdrawFileTree, file_id: str, diff_content: PlacementList, renamed: list,
+                         rename_counts: Counter, renamed_ids: set):
+    # Yields (file id, LDrawFile) for the difference file of file_id, unless it is empty, followed by
+    # the renamed copies of the moved submodels it references.
+    # Renamed copies are numbered in file order, so the output does not depend on the number of workers.
+    # Library files are complete in both models, their references stay as they are.
+    copies = []
+    for index in renamed:
+        sub_id = diff_content.references[index].lower()
+        if sub_id in model.external_ids:
+            continue
+        submodel = model.filetree[sub_id]
+        rename_counts[sub_id] += 1
+        suffix = f"{rename_counts[sub_id]:x}"
+        new_sub_id = f"{submodel.filename.lower()}_{suffix}"
+        # Case ID already used in model
+        while new_sub_id in model.filetree or new_sub_id in renamed_ids:
+            rename_counts[sub_id] += 1
+            suffix = f"{rename_counts[sub_id]:x}"
+            new_sub_id = f"{submodel.filename.lower()}_{suffix}"
+        renamed_ids.add(new_sub_id)
+        new_sub_header = submodel.header.copy()
+        for line_index in range(min(3, len(new_sub_header))):
+            new_sub_header[line_index] = new_sub_header[line_index].replace("\n", f"_{suffix}\n")
+        new_sub = LDrawFile(new_sub_header)
+        new_sub.content = submodel.content
+        copies.append((new_sub_id, new_sub))
+        diff_content.references[index] = f"{sub_id}_{suffix}"
+    if len(diff_content) > 0:
+        diff_file = LDrawFile(model.filetree[file_id].header)
+        diff_file.content = diff_content
+        yield file_id, diff_file
+    yield from copies
+
+
+def iter_difference_models(model_a: LdrawFileTree, model_b: LdrawFileTree, results: dict, symmetric: bool = False,
+                           release: bool = False, progress=None):
+    # Yields (output, file id, LDrawFile) with output ONLY_A, ONLY_B or A_AND_B, in file order for every output.
+    # Only B is only built if symmetric, results come from compare_files and are changed while building.
+    # Unchanged files share their content with model_a, nothing yielded may be modified.
+    # release drops the parts of the results that are no longer needed once they were yielded.
+    # Library files are left out, the difference models keep referencing them.
+    # progress(done_files, total_files, file id) is called before every file (and its lazy comparison),
+    # it may raise OperationCancelled.
+    total_files = len(model_a.filetree) - len(model_a.external_ids)
+    if symmetric:
+        total_files += len(model_b.filetree) - len(model_b.external_ids)
+    done_files = 0
+
+    def report(file_id):
+        nonlocal done_files
+        if progress is not None:
+            progress(done_files, total_files, file_id)
+        done_files += 1
+
+    rename_counts = Counter()
+    renamed_ids = set()
+    for file_id in model_a.filetree:
+        if file_id in model_a.external_ids:
+            continue
+        report(file_id)
+        ld_file = model_a.filetree[file_id]
+        if file_id not in model_b.filetree:
+            for diff_id, diff_file in iter_difference_file(model_a, file_id, ld_file.content, [], rename_counts,
+                                                           renamed_ids):
+                yield ONLY_A, diff_id, diff_file
+            continue
+        comm_file = LDrawFile(ld_file.header)
+        if file_id not in results:
+            # Whole subtree unchanged, everything is common
+            comm_file.content = ld_file.content
+            yield A_AND_B, file_id, comm_file
+            continue
+        diff_content, renamed, comm_file.content, diff_b, renamed_b = results[file_id]
+        yield A_AND_B, file_id, comm_file
+        for diff_id, diff_file in iter_difference_file(model_a, file_id, diff_content, renamed, rename_counts,
+                                                       renamed_ids):
+            yield ONLY_A, diff_id, diff_file
+        if release:
+            results[file_id] = (None, None, None, diff_b, renamed_b)
+    if not symmetric:
+        return
+    rename_counts = Counter()
+    renamed_ids = set()
+    for file_id in model_b.filetree:
+        if file_id in model_b.external_ids:
+            continue
+        report(file_id)
+        if file_id not in model_a.filetree:
+            diff_content, renamed = model_b.filetree[file_id].content, []
+        elif file_id in results:
+            _, _, _, diff_content, renamed = results[file_id]
+            if release:
+                del results[file_id]
         else:
-            diff_file.content = model_a.filetree[file_id].content
-            difference_model[file_id] = diff_file
+            continue
+        for diff_id, diff_file in iter_difference_file(model_b, file_id, diff_content, renamed, rename_counts,
+                                                       renamed_ids):
+            yield ONLY_B, diff_id, diff_file
+
+
+def collect_difference_models(model_a: LdrawFileTree, model_b: LdrawFileTree, results: dict, symmetric: bool = False):
+    # Returns (only A, only B, A and B) as dicts of file ids to LDrawFile objects, only B is None unless symmetric
+    models = ({}, {} if symmetric else None, {})
+    for output, file_id, ld_file in iter_difference_models(model_a, model_b, results, symmetric):
+        models[output][file_id] = ld_file
+    return models
+
+
+def get_difference_model(model_a: LdrawFileTree, model_b: LdrawFileTree, workers: int = 1, tolerance: tuple = None):
+    # tolerance is None for exact matching or (position in LDU, rotation matrix entries), see match_within_tolerance
+    results = compare_files(model_a, model_b, False, workers, tolerance=tolerance)
+    return build_difference_model(model_a, model_b, results)
+
+
+def build_difference_model(model_a: LdrawFileTree, model_b: LdrawFileTree, results: dict):
+    difference_model, _, common_model = collect_difference_models(model_a, model_b, results)
     return difference_model, common_model
 
 
+def get_symmetric_difference_model(model_a: LdrawFileTree, model_b: LdrawFileTree, workers: int = 1,
+                                   tolerance: tuple = None):
+    # Returns (only A, only B, A and B), every file pair is only compared once
+    results = compare_files(model_a, model_b, True, workers, tolerance=tolerance)
+    return build_symmetric_difference_model(model_a, model_b, results)
+
+
+def build_symmetric_difference_model(model_a: LdrawFileTree, model_b: LdrawFileTree, results: dict):
+    return collect_difference_models(model_a, model_b, results, True)
+
+
+def write_difference_models(model_a: LdrawFileTree, model_b: LdrawFileTree, results: dict, filepaths: tuple,
+                            release: bool = False, progress=None):
+    # Writes (only A, only B, A and B) to the filepaths that are not None while the files are built,
+    # so no output is held in memory completely. results need to be symmetric to write only B,
+    # with release every result is dropped once it is written (results must not be used afterwards).
+    # progress is called for every file, see iter_difference_models.
+    with get_profiler().phase("write"), ExitStack() as stack:
+        files = [None if filepath is None else stack.enter_context(open(filepath, "w", encoding="utf-8"))
+                 for filepath in filepaths]
+        symmetric = files[ONLY_B] is not None
+        for output, file_id, ld_file in iter_difference_models(model_a, model_b, results, symmetric, release, progress):
+            if files[output] is not None:
+                files[output].writelines(ld_file.iter_ldraw_lines())
+
+
+def get_flat_difference_model(model_a: LdrawFileTree, model_b: LdrawFileTree, symmetric: bool = False,
+                              tolerance: tuple = None):
+    # Compares the parts of both main models in world space, so submodels that were moved, restructured or
+    # renamed do not matter. Returns (only A, only B, A and B) as models of a single file each,
+    # only B is None unless symmetric.
+    content_a = model_a.get_flat_content()
+    content_b = model_b.get_flat_content()
+    with get_profiler().phase("compare"):
+        diff_a, _, comm_content, diff_b, _ = compare_placements(
+            content_a, content_b, set(), set(), set() if symmetric else None, tolerance
+        )
+    results = []
+    for model, content in ((model_a, diff_a), (model_b, diff_b), (model_a, comm_content)):
+        if content is None:
+            results.append(None)
+            continue
+        flat_file = LDrawFile(model.filetree[model.main_id].header)
+        flat_file.content = content
+        results.append({model.main_id: flat_file})
+    return tuple(results)
+
+
+def index_blocks(buffer) -> dict:
+    # Finds the byte range of every file in an mpd, a file ends with its "0 NOFILE" line
+    blocks = {}
+    start = 0
+    position = 0
+    size = len(buffer)
+    while True:
+        position = buffer.find(b"0 NOFILE", position)
+        if position == -1:
+            break
+        if position > 0 and buffer[position - 1] not in b"\r\n":
+            position += 1
+            continue
+        end = buffer.find(b"\n", position)
+        end = size if end == -1 else end + 1
+        blocks[get_block_id(buffer, start, end)] = (start, end)
+        start = position = end
+    if len(blocks) == 0:
+        blocks[get_block_id(buffer, 0, size)] = (0, size)
+    return blocks
+
+
+def get_block_digests(buffer, blocks: dict) -> dict:
+    with memoryview(buffer) as view:
+        return {file_id: blake2b(view[start:end], digest_size=FINGERPRINT_BITS // 8).digest()
+                for file_id, (start, end) in blocks.items()}
+
+
+def get_block_id(buffer, start: int, end: int) -> str:
+    line_end = buffer.find(b"\n", start, end)
+    if line_end == -1:
+        line_end = end
+    first_line = buffer[start:line_end].decode("utf-8").rstrip("\r")
+    return first_line[7:].lower()
+
+
+def decode_lines(data: bytes):
+    # Same newline handling as files opened in text mode
+    return io.StringIO(data.decode("utf-8"), newline=None)
+
+
 def save_model(model: dict, filepath):
-    with open(filepath, "w", encoding="utf-8") as file:
+    with get_profiler().phase("write"), open(filepath, "w", encoding="utf-8") as file:
         for ld_file in model.values():
-            file.writelines(ld_file.get_ldraw_lines())
+            file.writelines(ld_file.iter_ldraw_lines())
+
+
+def get_partlist_format(filepath) -> str:
+    extension = os.path.splitext(filepath)[1][1:].lower()
+    return extension if extension in PARTLIST_FORMATS else LDRAW_FORMAT
+
+
+def get_symmetric_part_difference(partlist_a: Partlist, partlist_b: Partlist):
+    # Returns (only A, only B, A and B)
+    return partlist_a.get_difference(partlist_b), partlist_b.get_difference(partlist_a), partlist_a.get_common(partlist_b)
 
 
 def get_part_difference(partlist_a: Partlist, partlist_b: Partlist):
-    diff_list = Partlist()
-    comm_list = Partlist()
-
-    for part in partlist_a.partlist:
-        if part in partlist_b.partlist:
-            if partlist_a.partlist[part] <= partlist_b.partlist[part]:
-                comm_list.partlist[part] = partlist_a.partlist[part]
-            elif partlist_a.partlist[part] > partlist_b.partlist[part]:
-                comm_list.partlist[part] = partlist_b.partlist[part]
-                diff = partlist_a.partlist[part] - partlist_b.partlist[part]
-                diff_list.partlist[part] = diff
+    return partlist_a.get_difference(partlist_b), partlist_a.get_common(partlist_b)
+
+
+class PartMatrix:
+    # Part x model count matrix, one count column per model over a PartVocabulary of all models.
+    # Everything is derived from the columns, no model is parsed or totaled again.
+    def __init__(self, partlists: list, names: list = None):
+        if names is None:
+            names = [f"model_{index}" for index in range(len(partlists))]
+        if len(names) != len(partlists):
+            raise ValueError("Every partlist needs a name")
+        self.names = list(names)
+        self.vocabulary = PartVocabulary(partlists)
+        self.columns = [self.vocabulary.get_counts(partlist) for partlist in partlists]
+
+    @classmethod
+    def from_trees(cls, filetrees: list, names: list = None):
+        return cls([filetree.total_partlist() for filetree in filetrees], names)
+
+    def get_partlist(self, model: int) -> Partlist:
+        return self.vocabulary.get_partlist(self.columns[model])
+
+    def get_difference(self, model_a: int, model_b: int) -> Partlist:
+        # Parts model_a has more of than model_b
+        return self.vocabulary.get_partlist(map(max, map(operator.sub, self.columns[model_a], self.columns[model_b]),
+                                                repeat(0)))
+
+    def get_pairwise_differences(self) -> dict:
+        differences = {}
+        for model_a in range(len(self.columns)):
+            for model_b in range(len(self.columns)):
+                if model_a != model_b:
+                    differences[(model_a, model_b)] = self.get_difference(model_a, model_b)
+        return differences
+
+    def reduce_columns(self, function) -> Partlist:
+        if len(self.columns) < 2:
+            return self.vocabulary.get_partlist(self.columns[0]) if len(self.columns) == 1 else Partlist()
+        return self.vocabulary.get_partlist(map(function, *self.columns))
+
+    def get_intersection(self) -> Partlist:
+        # Parts every model has
+        return self.reduce_columns(min)
+
+    def get_union(self) -> Partlist:
+        # Enough parts to build any one of the models
+        return self.reduce_columns(max)
+
+    def get_total(self) -> Partlist:
+        # Parts needed to build all models
+        total = array("q", bytes(8 * len(self.vocabulary.part_ids)))
+        for column in self.columns:
+            total = array("q", map(operator.add, total, column))
+        return self.vocabulary.get_partlist(total)
+
+    def iter_rows(self):
+        # (part id, counts per model) for every part at least one model has
+        part_ids = self.vocabulary.part_ids
+        for index, row in enumerate(zip(*self.columns)):
+            if any(row):
+                yield part_ids[index], row
+
+    def save_as_csv(self, filepath):
+        with open(filepath, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["colour", "part"] + self.names)
+            for part_id, row in self.iter_rows():
+                _, _, colour, partname = parse_part_id(part_id)
+                writer.writerow([colour, partname, *row])
+
+
+class DiffSession:
+    # Keeps both models and the last comparison, after reloading a changed file only the files that changed
+    # and the files referencing them are parsed, totaled and compared again
+    def __init__(self, filepath_a: str, filepath_b: str, use_mmap: bool = False, library=None, progress=None):
+        # progress(side, parsed_bytes, total_bytes, file id) is handed to the models, see LdrawFileTree
+        self.use_mmap = use_mmap
+        self.library = library
+        self.progress = progress
+        self.models = [None, None]
+        self.block_digests = [None, None]
+        # Symmetric compare_files results of the last comparison
+        self.results = None
+        # Files whose result is outdated because of a reload since the last comparison
+        self.outdated_ids = set()
+        self.load(0, filepath_a)
+        self.load(1, filepath_b)
+
+    @property
+    def model_a(self) -> LdrawFileTree:
+        return self.models[0]
+
+    @property
+    def model_b(self) -> LdrawFileTree:
+        return self.models[1]
+
+    def load(self, side: int, filepath: str = None) -> set:
+        # Loads (or reloads) model A (side 0) or B (side 1), returns the ids of the changed files
+        old_model = self.models[side]
+        if filepath is None:
+            filepath = old_model.filepath
+        model = LdrawFileTree(filepath, use_mmap=self.use_mmap, lazy=True, library=self.library,
+                              progress=self.get_model_progress(side))
+        block_digests = model.get_block_digests()
+        if old_model is None:
+            changed_ids = set(model.filetree)
+        else:
+            changed_ids = model.reuse_files(old_model, block_digests, self.block_digests[side])
+        self.models[side] = model
+        self.block_digests[side] = block_digests
+        if self.results is not None:
+            # A result also depends on the submodels of the other model
+            for other in self.models:
+                self.outdated_ids |= other.get_ancestors(changed_ids)
+        return changed_ids
+
+    def get_model_progress(self, side: int):
+        return None if self.progress is None else partial(self.progress, side)
+
+    def set_progress(self, progress):
+        # Replaces progress, also for the files of both models that are parsed later on
+        self.progress = progress
+        for side, model in enumerate(self.models):
+            model.progress = self.get_model_progress(side)
+
+    def reload_a(self) -> set:
+        return self.load(0)
+
+    def reload_b(self) -> set:
+        return self.load(1)
+
+    def compare(self, workers: int = 1) -> dict:
+        # Symmetric compare_files results for A and B
+        self.results = compare_files(self.model_a, self.model_b, True, workers, self.results, self.outdated_ids)
+        self.outdated_ids = set()
+        # Building the difference models renames references in the differences, so it gets copies of them
+        results = {}
+        for file_id, (diff_a, renamed_a, comm, diff_b, renamed_b) in self.results.items():
+            results[file_id] = (diff_a.copy(), renamed_a, comm, diff_b.copy(), renamed_b)
+        return results
+
+    def get_symmetric_difference_model(self, workers: int = 1):
+        # Same as get_symmetric_difference_model(session.model_a, session.model_b)
+        return build_symmetric_difference_model(self.model_a, self.model_b, self.compare(workers))
+
+    def generate_difference_files(self, mode: str, *args, **kwargs) -> list:
+        return generate_difference_files(self.model_a, self.model_b, mode, *args, session=self, **kwargs)
+
+
+def generate_difference_files(filetree_a: LdrawFileTree, filetree_b: LdrawFileTree, mode: str,
+                              filepath_a_and_b: str = None, filepath_only_a: str = None,
+                              filepath_only_b: str = None, col_distance=165, row_distance=165,
+                              height_distance=35, workers: int = 1, progress=None, compact=False,
+                              session: DiffSession = None, tolerance: tuple = None,
+                              partlist_format: str = None) -> list:
+    # Writes every output that has a filepath and returns the saved filepaths.
+    # Partlists are written in partlist_format, by default depending on the file extension (see Partlist.save_as_file).
+    # progress(done_steps, total_steps, message) is called before every step, it may raise
+    # OperationCancelled to stop before the next step. Difference models are compared and written file by file,
+    # every file counts as a fraction of the writing step.
+    # With a session (holding filetree_a and filetree_b) difference models reuse its earlier results,
+    # difference models with a tolerance are always compared completely.
+    generate_a_and_b = filepath_a_and_b is not None
+    generate_only_a = filepath_only_a is not None
+    generate_only_b = filepath_only_b is not None
+    if mode not in (PARTLIST_MODE, DIFF_MODEL_MODE, FLAT_MODEL_MODE):
+        raise ValueError(f"Unknown mode '{mode}'")
+    out_a_and_b = out_only_a = out_only_b = None
+    if mode == DIFF_MODEL_MODE:
+        # All difference models are written in a single pass, see report_file
+        total_steps = 2
+    else:
+        total_steps = 1 + generate_a_and_b + generate_only_a + generate_only_b
+    done_steps = 0
+
+    def report(message):
+        nonlocal done_steps
+        if progress is not None:
+            progress(done_steps, total_steps, message)
+        done_steps += 1
+
+    def report_file(done_files, total_files, file_id):
+        if progress is not None:
+            progress((done_steps - 1) * total_files + done_files, total_steps * total_files, f"Writing {file_id}")
+
+    report("Comparing A and B")
+    if mode == PARTLIST_MODE:
+        partlist_a = filetree_a.total_partlist()
+        partlist_b = filetree_b.total_partlist()
+        with get_profiler().phase("compare"):
+            if generate_only_a and generate_only_b:
+                out_only_a, out_only_b, out_a_and_b = get_symmetric_part_difference(partlist_a, partlist_b)
+            elif generate_only_b:
+                out_only_b, out_a_and_b = get_part_difference(partlist_b, partlist_a)
+            else:
+                out_only_a, out_a_and_b = get_part_difference(partlist_a, partlist_b)
+    elif mode == FLAT_MODEL_MODE:
+        if generate_only_b and not generate_only_a:
+            out_only_b, _, out_a_and_b = get_flat_difference_model(filetree_b, filetree_a, False, tolerance)
+        else:
+            out_only_a, out_only_b, out_a_and_b = get_flat_difference_model(filetree_a, filetree_b,
+                                                                            generate_only_b, tolerance)
+    else:
+        # Without a session files are only compared while they are written and dropped afterwards
+        if session is not None and tolerance is None:
+            results = session.compare(workers)
+            model_outputs = (filetree_a, filetree_b, results, (filepath_only_a, filepath_only_b, filepath_a_and_b))
+        elif generate_only_b and not generate_only_a:
+            results = compare_files(filetree_b, filetree_a, False, workers, tolerance=tolerance, lazy=True)
+            model_outputs = (filetree_b, filetree_a, results, (filepath_only_b, None, filepath_a_and_b))
+        else:
+            results = compare_files(filetree_a, filetree_b, generate_only_b, workers, tolerance=tolerance, lazy=True)
+            model_outputs = (filetree_a, filetree_b, results, (filepath_only_a, filepath_only_b, filepath_a_and_b))
+        report("Writing difference models")
+        write_difference_models(*model_outputs, release=True, progress=report_file)
+
+    saved_files = []
+    for filepath, result in ((filepath_a_and_b, out_a_and_b), (filepath_only_a, out_only_a),
+                             (filepath_only_b, out_only_b)):
+        if filepath is None:
+            continue
+        saved_files.append(filepath)
+        if mode == DIFF_MODEL_MODE:
+            continue
+        report(f"Writing {os.path.basename(filepath)}")
+        if mode == PARTLIST_MODE:
+            result.save_as_file(filepath, partlist_format, col_distance, row_distance, height_distance, compact)
         else:
-            diff_list.partlist[part] = partlist_a.partlist[part]
-    return diff_list, comm_list
+            save_model(result, filepath)
+    profiler = get_profiler()
+    if profiler.enabled:
+        # Files of both models and how many of them never had to be parsed
+        for filetree in (filetree_a, filetree_b):
+            statistics = filetree.get_load_statistics()
+            profiler.count("files", statistics["files"])
+            profiler.count("files_unparsed", statistics["unparsed"])
+    if progress is not None:
+        progress(total_steps, total_steps, "Done")
+    return saved_files
 
 
 if __name__ == "__main__":
@@ -274,9 +1610,7 @@ if __name__ == "__main__":
 
     file_tree_a = LdrawFileTree(testfile_a)
     file_tree_b = LdrawFileTree(testfile_b)
-    part_diff, part_comm = get_part_difference(
-        list(file_tree_a.filetree.values())[0].get_total_partlist(),
-        list(file_tree_b.filetree.values())[0].get_total_partlist())
+    part_diff, part_comm = get_part_difference(file_tree_a.total_partlist(), file_tree_b.total_partlist())
 
     for line in part_comm.generate_ldraw_model("diff_partlist", 85, 25, 25):
         print(line.strip("\n"))
@@ -288,5 +1622,5 @@ if __name__ == "__main__":
         for lline in sub.get_ldraw_lines():
             print(lline.strip("\n"))
 
-    total_a = list(file_tree_a.filetree.values())[0].get_total_partlist()
+    total_a = file_tree_a.total_partlist()
     print(total_a)
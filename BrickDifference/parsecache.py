@@ -0,0 +1,108 @@
+import os
+import pickle
+import zlib
+from hashlib import blake2b
+
+# Cache files are plain pickles, only point the cache at a directory nobody else can write to
+
+CACHE_SUFFIX = ".bdcache"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_content_hash(filepath) -> str:
+    digest = blake2b(digest_size=20)
+    with open(filepath, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    # Directory of serialized parse results. The modification time of an entry is its last use,
+    # the least recently used entries are removed when the directory grows beyond max_bytes.
+    def __init__(self, directory: str, max_bytes: int = 512 << 20):
+        if max_bytes <= 0:
+            raise ValueError("The cache size has to be positive")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, key: str):
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as file:
+                state = pickle.loads(zlib.decompress(file.read()))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError, AttributeError, ImportError):
+            # Damaged or written by an incompatible version, it gets replaced on the next put
+            self.remove(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # A readable entry of another user or on a read-only disk is still used, it just ages
+            pass
+        self.hits += 1
+        return state
+
+    def put(self, key: str, state):
+        path = self.get_path(key)
+        data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+        if len(data) > self.max_bytes:
+            return
+        # Written under a temporary name first, so other processes never read half a file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+            self.evict()
+        except OSError:
+            # The cache is only an optimization, a full disk or read-only directory must not fail the parse
+            self.remove(temp_path)
+
+    def get_entries(self) -> list:
+        # (last use, size, path) of every entry, oldest first
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def get_size(self) -> int:
+        return sum(size for _, size, _ in self.get_entries())
+
+    def evict(self):
+        entries = self.get_entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            self.remove(path)
+            total_size -= size
+
+    def clear(self):
+        for _, _, path in self.get_entries():
+            self.remove(path)
+
+    @staticmethod
+    def remove(path: str):
+        # Entries that can not be removed stay, like entries another process is using on Windows
+        try:
+            os.remove(path)
+        except OSError:
+            pass
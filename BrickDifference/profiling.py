@@ -0,0 +1,161 @@
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+from threading import Lock, local
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Returned by every phase of the NullProfiler, entering and leaving it does nothing
+NULL_PHASE = nullcontext()
+
+
+class NullProfiler:
+    # Active while no Profiler is, so the instrumented functions only pay for a method call
+    enabled = False
+
+    def phase(self, name: str):
+        return NULL_PHASE
+
+    def count(self, name: str, amount: int = 1):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+# The active profiler is shared by the whole process, only one Profiler can be active at a time
+active_profiler = NULL_PROFILER
+
+
+def get_profiler():
+    return active_profiler
+
+
+class Phase:
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        # Time spent in phases started inside this one
+        self.nested = 0.0
+
+    def __enter__(self):
+        self.profiler.get_stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler.get_stack()
+        stack.pop()
+        if len(stack) > 0:
+            stack[-1].nested += elapsed
+        with self.profiler.lock:
+            statistics = self.profiler.phases.setdefault(self.name, [0, 0.0, 0.0])
+            statistics[0] += 1
+            statistics[1] += elapsed
+            statistics[2] += elapsed - self.nested
+        return False
+
+
+class Profiler:
+    # Collects the wall time of the instrumented phases, counters and the peak memory while it is active:
+    #     with Profiler() as profiler:
+    #         generate_difference_files(...)
+    #     report = profiler.get_report()
+    # The "self" time of a phase excludes the phases nested in it, e.g. comparisons done while writing.
+    # Phases of threads running at the same time are all counted, so their sum can exceed the wall time.
+    # trace_memory measures the peak of the Python allocations with tracemalloc, which slows everything down.
+    enabled = True
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        # Name to [calls, total seconds, self seconds]
+        self.phases = {}
+        self.counters = Counter()
+        # Every thread has its own stack of running phases
+        self.threads = local()
+        self.lock = Lock()
+        self.wall_time = 0.0
+        self.peak_traced = None
+        self.started_tracing = False
+        self.start = None
+        self.previous = None
+
+    def get_stack(self) -> list:
+        if not hasattr(self.threads, "stack"):
+            self.threads.stack = []
+        return self.threads.stack
+
+    def phase(self, name: str) -> Phase:
+        return Phase(self, name)
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def __enter__(self):
+        global active_profiler
+        if active_profiler.enabled:
+            raise ValueError("Another profiler is already active")
+        self.previous = active_profiler
+        active_profiler = self
+        if self.trace_memory:
+            self.started_tracing = not tracemalloc.is_tracing()
+            if self.started_tracing:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global active_profiler
+        self.wall_time += time.perf_counter() - self.start
+        if self.trace_memory:
+            self.peak_traced = max(self.peak_traced or 0, tracemalloc.get_traced_memory()[1])
+            if self.started_tracing:
+                tracemalloc.stop()
+        active_profiler = self.previous
+        return False
+
+    def get_report(self) -> dict:
+        # JSON serializable, times are in seconds and memory in MiB
+        memory = {"peak_traced": None, "peak_rss": get_peak_rss()}
+        if self.peak_traced is not None:
+            memory["peak_traced"] = round(self.peak_traced / (1 << 20), 3)
+        return {
+            "wall_time": round(self.wall_time, 6),
+            "phases": {name: {"calls": calls, "total": round(total, 6), "self": round(own, 6)}
+                       for name, (calls, total, own) in self.phases.items()},
+            "counters": dict(self.counters),
+            "memory": memory
+        }
+
+    def get_summary(self) -> list:
+        # Report as lines of text, phases with the most time spent in them first
+        report = self.get_report()
+        lines = [f"Total: {report['wall_time']:.3f} s"]
+        for name, phase in sorted(report["phases"].items(), key=lambda item: -item[1]["self"]):
+            lines.append(f"{name}: {phase['self']:.3f} s ({phase['calls']}x)")
+        for name, amount in sorted(report["counters"].items()):
+            lines.append(f"{name.replace('_', ' ')}: {amount}")
+        for name, value in report["memory"].items():
+            if value is not None:
+                lines.append(f"{name.replace('_', ' ')} memory: {value:.1f} MiB")
+        return lines
+
+
+def get_peak_rss():
+    # Peak resident memory of the process in MiB, None where the platform does not tell
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB everywhere else
+    if sys.platform == "darwin":
+        return round(peak / (1 << 20), 3)
+    return round(peak / (1 << 10), 3)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from BrickDifference.cli import get_tolerance, run_job
+from BrickDifference.modelFunctions import (
+    LdrawFileTree,
+    get_symmetric_part_difference,
+    PARTLIST_MODE,
+    DIFF_MODEL_MODE,
+    FLAT_MODEL_MODE
+)
+from BrickDifference.watch import get_file_signature
+
+# Anybody who can connect can read and write files as the user running the service,
+# only listen on localhost or on a Unix socket with suitable permissions
+
+MAX_REQUEST_BYTES = 1 << 20
+STATUS_TEXTS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class TreeCache:
+    # Keeps up to max_trees parsed trees in memory, together with their fingerprints and totals.
+    # A tree is parsed again once the modification time or size of its file changed.
+    def __init__(self, max_trees: int = 16, library=None):
+        if max_trees < 1:
+            raise ValueError("The service has to keep at least one model")
+        self.max_trees = max_trees
+        self.library = library
+        # Absolute path to ((modification time, size), tree), least recently used first
+        self.trees = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_tree(self, filepath: str) -> LdrawFileTree:
+        filepath = os.path.abspath(filepath)
+        signature = get_file_signature(filepath)
+        if signature is None:
+            raise ValueError(f"'{filepath}' does not exist")
+        if filepath in self.trees and self.trees[filepath][0] == signature:
+            self.trees.move_to_end(filepath)
+            self.hits += 1
+            return self.trees[filepath][1]
+        self.misses += 1
+        self.trees.pop(filepath, None)
+        tree = LdrawFileTree(filepath, library=self.library)
+        self.trees[filepath] = (signature, tree)
+        while len(self.trees) > self.max_trees:
+            self.trees.popitem(last=False)
+        return tree
+
+    def get_statistics(self) -> dict:
+        return {"trees": len(self.trees), "max_trees": self.max_trees, "hits": self.hits, "misses": self.misses}
+
+
+class DiffService:
+    # Answers difference requests over a minimal HTTP/1.1 front end:
+    #     POST /partlist, /model or /flat with a JSON job like a batch manifest entry, returns {"saved": [...]}
+    #     GET /status returns statistics of the tree cache
+    # A partlist job without any output returns the partlists as {"only_a": [[colour, part, quantity], ...], ...}.
+    # Clients are served concurrently, the comparisons run one after another in a worker thread,
+    # so a tree is never used by two comparisons at the same time.
+    def __init__(self, cache: TreeCache, workers: int = 1, overwrite: bool = False):
+        self.cache = cache
+        self.workers = workers
+        self.overwrite = overwrite
+        self.requests = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def run(self, mode: str, job: dict) -> dict:
+        if not isinstance(job, dict):
+            raise ValueError("The job has to be a JSON object")
+        outputs = [job.get(key) for key in ("a_and_b", "only_a", "only_b")]
+        if mode == PARTLIST_MODE and all(output is None for output in outputs):
+            partlists = get_symmetric_part_difference(self.cache.get_tree(job["a"]).total_partlist(),
+                                                      self.cache.get_tree(job["b"]).total_partlist())
+            return {key: [list(row) for row in partlist.iter_rows()]
+                    for key, partlist in zip(("only_a", "only_b", "a_and_b"), partlists)}
+        saved_files = run_job(
+            self.cache, mode, job["a"], job["b"], *outputs,
+            job.get("column_distance", 165), job.get("row_distance", 165), job.get("height_distance", 35),
+            self.workers, job.get("overwrite", self.overwrite), job.get("compact", False),
+            get_tolerance(job.get("position_tolerance"), job.get("rotation_tolerance")), job.get("format")
+        )
+        return {"saved": saved_files}
+
+    async def handle_request(self, method: str, path: str, body: bytes):
+        # Returns (status, response object)
+        if path == "/status":
+            if method != "GET":
+                return 405, {"error": "Use GET"}
+            return 200, {"requests": self.requests, **self.cache.get_statistics()}
+        mode = path.lstrip("/")
+        if mode not in (PARTLIST_MODE, DIFF_MODEL_MODE, FLAT_MODEL_MODE):
+            return 404, {"error": f"Unknown path '{path}'"}
+        if method != "POST":
+            return 405, {"error": "Use POST"}
+        try:
+            job = json.loads(body)
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, self.run, mode, job)
+        except KeyError as error:
+            return 400, {"error": f"Missing {error}"}
+        except (ValueError, TypeError, OSError) as error:
+            return 400, {"error": str(error)}
+        except Exception as error:
+            # Any other failure only ends this request, the service keeps running
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+        return 200, result
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, response = await self.read_request(reader)
+            content = json.dumps(response).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status} {STATUS_TEXTS[status]}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(content)}\r\nConnection: close\r\n\r\n".encode("ascii") + content)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return 400, {"error": "Invalid request line"}
+        method, path, _ = request_line
+        content_length = 0
+        while (line := (await reader.readline()).decode("latin-1").strip()) != "":
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                if not value.strip().isdigit():
+                    return 400, {"error": "Invalid Content-Length"}
+                content_length = int(value)
+        if content_length > MAX_REQUEST_BYTES:
+            return 413, {"error": f"Requests are limited to {MAX_REQUEST_BYTES} bytes"}
+        body = await reader.readexactly(content_length)
+        self.requests += 1
+        return await self.handle_request(method, path, body)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, socket_path: str = None):
+        # Listens on the Unix socket socket_path if given, otherwise on host and port
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def run_service(host: str = "127.0.0.1", port: int = 8765, socket_path: str = None, max_trees: int = 16,
+                workers: int = 1, overwrite: bool = False, library=None):
+    service = DiffService(TreeCache(max_trees, library), workers, overwrite)
+    try:
+        asyncio.run(service.serve(host, port, socket_path))
+    finally:
+        service.executor.shutdown()
@@ -0,0 +1,49 @@
+import os
+import time
+
+
+def get_file_signature(filepath):
+    # None while the file does not exist, e.g. in the middle of a save that replaces it
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileWatcher:
+    # Polls the modification time and size of some files. Changes are only reported once no file changed for
+    # debounce seconds, so the bursts of writes of a single save are reported once.
+    def __init__(self, filepaths, interval: float = 0.5, debounce: float = 1.0):
+        if interval <= 0 or debounce < 0:
+            raise ValueError("The poll interval has to be positive and the debounce time can not be negative")
+        self.filepaths = list(filepaths)
+        self.interval = interval
+        self.debounce = debounce
+        self.signatures = {filepath: get_file_signature(filepath) for filepath in self.filepaths}
+        # Time of the last seen change of every file with an unreported change
+        self.pending = {}
+
+    def poll(self) -> list:
+        # Returns the changed files once the changes settled, otherwise an empty list
+        now = time.monotonic()
+        for filepath in self.filepaths:
+            signature = get_file_signature(filepath)
+            if signature != self.signatures[filepath]:
+                self.signatures[filepath] = signature
+                self.pending[filepath] = now
+        if len(self.pending) == 0:
+            return []
+        if any(now - changed < self.debounce or self.signatures[filepath] is None
+               for filepath, changed in self.pending.items()):
+            return []
+        changed_files = [filepath for filepath in self.filepaths if filepath in self.pending]
+        self.pending.clear()
+        return changed_files
+
+    def wait(self) -> list:
+        while True:
+            changed_files = self.poll()
+            if len(changed_files) > 0:
+                return changed_files
+            time.sleep(self.interval)
@@ -0,0 +1,45 @@
+"""Cold and warm load of LdrawFileTree with a ParseCache.
+
+"cold" parses the model and writes the cache entry, "warm" only reads the entry back.
+Both include totaling the main model, like a partlist comparison does.
+Run from the repository root:
+    python -m benchmarks.bench_cache [line counts...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_parse import write_model
+from BrickDifference.modelFunctions import LdrawFileTree
+from BrickDifference.parsecache import ParseCache
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def load(filepath, cache):
+    start = time.perf_counter()
+    tree = LdrawFileTree(filepath, lazy=True, cache=cache)
+    tree.total_partlist()
+    return time.perf_counter() - start, tree.from_cache
+
+
+def run(sizes):
+    rng = random.Random(42)
+    print(f"{'lines':>10} {'no cache s':>11} {'cold s':>8} {'warm s':>8} {'entry MiB':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, "model.ldr")
+        for size in sizes:
+            write_model(filepath, size, rng)
+            cache = ParseCache(os.path.join(tmpdir, f"cache_{size}"), 4 << 30)
+            uncached, _ = load(filepath, None)
+            cold, _ = load(filepath, cache)
+            warm, from_cache = load(filepath, cache)
+            assert from_cache
+            print(f"{size:>10} {uncached:>11.3f} {cold:>8.3f} {warm:>8.3f} {cache.get_size() / (1 << 20):>10.1f} "
+                  f"{uncached / warm:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
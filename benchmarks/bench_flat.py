@@ -0,0 +1,60 @@
+"""Expansion of nested submodels into world space and the flattened difference.
+
+The model has DEPTH levels of submodels, each placing the level below FANOUT times with a rotation,
+the lowest level holds PARTS parts. B rotates one placement on the middle level by 90 degrees.
+Run from the repository root:
+    python -m benchmarks.bench_flat [parts per lowest submodel...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from BrickDifference.modelFunctions import LdrawFileTree, get_flat_difference_model
+
+DEFAULT_SIZES = [10, 100, 1000]
+DEPTH = 4
+FANOUT = 8
+ROTATED = "0 0 1 0 1 0 -1 0 0"
+IDENTITY = "1 0 0 0 1 0 0 0 1"
+
+
+def write_model(filepath, parts, changed=False):
+    with open(filepath, "w", encoding="utf-8") as file:
+        for level in range(DEPTH):
+            file.write(f"0 FILE level_{level}.ldr\n0 level_{level}\n0 Name:  level_{level}.ldr\n0 Author: \n")
+            if level == DEPTH - 1:
+                for index in range(parts):
+                    file.write(f"1 {index % 16} {index % 10 * 20} 0 {index // 10 * 20} {IDENTITY} 3001.dat\n")
+            else:
+                for index in range(FANOUT):
+                    rotation = ROTATED if index % 2 else IDENTITY
+                    if changed and level == DEPTH // 2 and index == 0:
+                        rotation = ROTATED
+                    file.write(f"1 16 {index * 400} {-level * 24} 0 {rotation} level_{level + 1}.ldr\n")
+            file.write("0 NOFILE\n")
+
+
+def run(sizes):
+    print(f"{'parts':>10} {'flat parts':>11} {'expand s':>9} {'us/part':>8} {'diff s':>8} {'only A':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path_a = os.path.join(tmpdir, "a.ldr")
+        path_b = os.path.join(tmpdir, "b.ldr")
+        for parts in sizes:
+            write_model(path_a, parts)
+            write_model(path_b, parts, changed=True)
+            tree_a = LdrawFileTree(path_a)
+            tree_b = LdrawFileTree(path_b)
+            start = time.perf_counter()
+            flat_parts = len(tree_a.get_flat_content())
+            expanded = time.perf_counter() - start
+            start = time.perf_counter()
+            only_a, _, _ = get_flat_difference_model(tree_a, tree_b)
+            compared = time.perf_counter() - start
+            only_a_parts = len(only_a[tree_a.main_id].content)
+            print(f"{parts:>10} {flat_parts:>11} {expanded:>9.3f} {expanded / flat_parts * 1e6:>8.2f} "
+                  f"{compared:>8.3f} {only_a_parts:>8}")
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,66 @@
+"""Scaling benchmark for the line matching in get_difference_model.
+
+Run from the repository root:
+    python -m benchmarks.bench_matching [line counts...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from BrickDifference.modelFunctions import LdrawFileTree, get_difference_model
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+PART_NAMES = ["3001.dat", "3003.dat", "3004.dat", "3010.dat", "3020.dat", "3022.dat", "3023.dat", "3069b.dat"]
+COLOURS = [0, 1, 2, 4, 14, 15, 19, 71, 72]
+
+
+def write_model(filepath, lines):
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.write("0 FILE main.ldr\n0 Untitled Model\n0 Name:  main.ldr\n0 Author: \n")
+        file.writelines(lines)
+        file.write("0 NOFILE\n")
+
+
+def generate_placements(count, rng):
+    placements = []
+    for i in range(count):
+        position = ((i % 100) * 20, -(i // 10000) * 24, ((i // 100) % 100) * 20)
+        placements.append((rng.choice(COLOURS), position, rng.choice(PART_NAMES)))
+    return placements
+
+
+def to_line(colour, position, part):
+    x, y, z = position
+    return f"1 {colour} {x} {y} {z} 1 0 0 0 1 0 0 0 1 {part}\n"
+
+
+def run(sizes):
+    rng = random.Random(42)
+    print(f"{'lines':>10} {'seconds':>10} {'us/line':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path_a = os.path.join(tmpdir, "a.ldr")
+        path_b = os.path.join(tmpdir, "b.ldr")
+        for size in sizes:
+            placements = generate_placements(size, rng)
+            lines_a = [to_line(*placement) for placement in placements]
+            # B moves 5% of the parts of A sideways and lists them in a different order
+            lines_b = []
+            for colour, (x, y, z), part in placements:
+                if rng.random() < 0.05:
+                    x += 10
+                lines_b.append(to_line(colour, (x, y, z), part))
+            rng.shuffle(lines_b)
+            write_model(path_a, lines_a)
+            write_model(path_b, lines_b)
+            tree_a = LdrawFileTree(path_a)
+            tree_b = LdrawFileTree(path_b)
+            start = time.perf_counter()
+            get_difference_model(tree_a, tree_b)
+            elapsed = time.perf_counter() - start
+            print(f"{size:>10} {elapsed:>10.3f} {elapsed / size * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
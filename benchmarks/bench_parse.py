@@ -0,0 +1,124 @@
+"""Parse throughput and peak memory of LdrawFileTree.
+
+Every size is parsed in a fresh interpreter so the peak RSS only covers that parse.
+"open" is the time until LdrawFileTree returns, "total" also includes totaling the main model,
+which makes the lazy and memory-mapped modes parse every reachable submodel.
+With --baseline the same models are also parsed by the package of another commit (checked out into a
+temporary git worktree), "vs base" is the time and peak RSS of that commit divided by those of this tree.
+Run from the repository root:
+    python -m benchmarks.bench_parse [--baseline REF] [line counts...]
+"""
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+SUBMODEL_SIZE = 1000
+
+
+def write_model(filepath, size, rng):
+    # Main model referencing submodels of SUBMODEL_SIZE parts each
+    from benchmarks.bench_matching import generate_placements, to_line
+
+    placements = generate_placements(size, rng)
+    submodel_count = max(1, size // SUBMODEL_SIZE)
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.write("0 FILE main.ldr\n0 Untitled Model\n0 Name:  main.ldr\n0 Author: \n")
+        for index in range(submodel_count):
+            file.write(f"1 0 0 {-index * 24} 0 1 0 0 0 1 0 0 0 1 sub_{index}.ldr\n")
+        file.write("0 NOFILE\n")
+        for index in range(submodel_count):
+            file.write(f"0 FILE sub_{index}.ldr\n0 sub_{index}\n0 Name:  sub_{index}.ldr\n0 Author: \n")
+            chunk = placements[index * SUBMODEL_SIZE:(index + 1) * SUBMODEL_SIZE]
+            file.writelines(to_line(*placement) for placement in chunk)
+            file.write("0 NOFILE\n")
+
+
+def parse(filepath, mode):
+    from BrickDifference.modelFunctions import LdrawFileTree
+
+    start = time.perf_counter()
+    # Older commits only know the text mode
+    tree = LdrawFileTree(filepath) if mode == "text" else LdrawFileTree(filepath, use_mmap=mode == "mmap",
+                                                                         lazy=mode == "lazy")
+    opened = time.perf_counter() - start
+    if hasattr(tree, "total_partlist"):
+        tree.total_partlist()
+    else:
+        next(iter(tree.filetree.values())).get_total_partlist()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"open": opened, "seconds": elapsed, "lines": getattr(tree, "line_count", None),
+                      "max_rss_kib": get_max_rss()}))
+
+
+def get_max_rss():
+    # In KiB. On Linux ru_maxrss keeps the peak of the forking benchmark process, VmHWM starts fresh with exec.
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        max_rss //= 1024
+    return max_rss
+
+
+def run_parse(filepath, mode, source=None):
+    # Parses in a fresh interpreter, with the package of source instead of this tree if given
+    command = [sys.executable, "-m", "benchmarks.bench_parse", "--parse", filepath, mode]
+    if source is not None:
+        command.append(source)
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def run(sizes, baseline=None):
+    rng = random.Random(42)
+    header = f"{'mode':>6} {'lines':>10} {'MiB':>8} {'open s':>8} {'total s':>8} {'lines/s':>10} {'peak RSS MiB':>13}"
+    print(header if baseline is None else f"{header}{'vs base':>16}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, "model.ldr")
+        source = os.path.join(tmpdir, "baseline")
+        if baseline is not None:
+            subprocess.run(["git", "worktree", "add", "--detach", source, baseline], check=True, capture_output=True)
+        try:
+            for size in sizes:
+                write_model(filepath, size, rng)
+                file_size = os.path.getsize(filepath) / 2 ** 20
+                modes = ["text", "lazy", "mmap"]
+                results = {mode: run_parse(filepath, mode) for mode in modes}
+                if baseline is not None:
+                    modes.insert(0, "base")
+                    results["base"] = run_parse(filepath, "text", source)
+                    results["base"]["lines"] = results["text"]["lines"]
+                for mode in modes:
+                    result = results[mode]
+                    row = (f"{mode:>6} {result['lines']:>10} {file_size:>8.1f} {result['open']:>8.3f} "
+                           f"{result['seconds']:>8.3f} {result['lines'] / result['seconds']:>10.0f} "
+                           f"{result['max_rss_kib'] / 1024:>13.1f}")
+                    if baseline is not None:
+                        speedup = results["base"]["seconds"] / result["seconds"]
+                        memory = results["base"]["max_rss_kib"] / result["max_rss_kib"]
+                        row += f"{speedup:>8.2f}x {memory:>5.2f}x"
+                    print(row)
+        finally:
+            if baseline is not None:
+                subprocess.run(["git", "worktree", "remove", "--force", source], check=True, capture_output=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "--parse":
+        # The package of another commit is imported instead of this tree
+        sys.path[:0] = sys.argv[4:]
+        parse(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) > 2 and sys.argv[1] == "--baseline":
+        run([int(arg) for arg in sys.argv[3:]] or DEFAULT_SIZES, sys.argv[2])
+    else:
+        run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
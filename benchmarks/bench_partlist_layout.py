@@ -0,0 +1,46 @@
+"""Micro-benchmark for the grid layout of Partlist.generate_ldraw_model.
+
+Uses compact output, so the time is spent on sorting and placing the unique parts
+rather than on writing one line per part. "cold" includes parsing the part ids,
+"warm" reuses the parsed keys of the same Partlist.
+Run from the repository root:
+    python -m benchmarks.bench_partlist_layout [unique parts]
+"""
+import random
+import sys
+import time
+
+from BrickDifference.modelFunctions import Partlist
+
+REPEATS = 5
+
+
+def generate_partlist(unique_parts, rng):
+    partlist = Partlist()
+    colours = [str(colour) for colour in range(0, 500, 3)] + ["0x2FF0000", "0x2112233"]
+    while len(partlist.partlist) < unique_parts:
+        name = f"{rng.randint(1, 99999)}{rng.choice(['', 'a', 'b', 'pr0001'])}.dat"
+        partlist.add_part(f"{rng.choice(colours)}:{name}", rng.randint(1, 20))
+    return partlist
+
+
+def run(unique_parts):
+    rng = random.Random(42)
+    partlist = generate_partlist(unique_parts, rng)
+    cold = []
+    warm = []
+    for _ in range(REPEATS):
+        fresh = Partlist(partlist.partlist.copy())
+        start = time.perf_counter()
+        fresh.generate_ldraw_model("layout.ldr", compact=True)
+        cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        fresh.generate_ldraw_model("layout.ldr", compact=True)
+        warm.append(time.perf_counter() - start)
+    print(f"{unique_parts} unique parts, best of {REPEATS}")
+    print(f"cold: {min(cold) * 1000:.1f} ms")
+    print(f"warm: {min(warm) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,68 @@
+"""Re-diff after one submodel changed, DiffSession against a full comparison.
+
+B starts as a copy of A, then one placement of one submodel of B is moved and B is compared again.
+"full" loads both models and builds the difference model and both totals from scratch,
+"session" only reloads B in a DiffSession that already compared the previous version.
+Run from the repository root:
+    python -m benchmarks.bench_session [line counts...]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_parse import write_model
+from BrickDifference.modelFunctions import DiffSession, LdrawFileTree, get_symmetric_difference_model
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def change_one_submodel(filepath):
+    with open(filepath, "r", encoding="utf-8") as file:
+        lines = file.readlines()
+    index = lines.index("0 FILE sub_0.ldr\n") + 4
+    parameters = lines[index].split(" ")
+    parameters[2] = str(float(parameters[2]) + 20)
+    lines[index] = " ".join(parameters)
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.writelines(lines)
+
+
+def compare(model_a, model_b):
+    get_symmetric_difference_model(model_a, model_b)
+    model_a.total_partlist()
+    model_b.total_partlist()
+
+
+def run(sizes):
+    rng = random.Random(42)
+    print(f"{'lines':>10} {'full s':>8} {'session s':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath_a = os.path.join(tmpdir, "a.ldr")
+        filepath_b = os.path.join(tmpdir, "b.ldr")
+        for size in sizes:
+            write_model(filepath_a, size, rng)
+            shutil.copyfile(filepath_a, filepath_b)
+            session = DiffSession(filepath_a, filepath_b)
+            session.get_symmetric_difference_model()
+            session.model_a.total_partlist()
+            session.model_b.total_partlist()
+            change_one_submodel(filepath_b)
+
+            start = time.perf_counter()
+            compare(LdrawFileTree(filepath_a), LdrawFileTree(filepath_b))
+            full = time.perf_counter() - start
+
+            start = time.perf_counter()
+            session.reload_b()
+            session.get_symmetric_difference_model()
+            session.model_a.total_partlist()
+            session.model_b.total_partlist()
+            incremental = time.perf_counter() - start
+            print(f"{size:>10} {full:>8.3f} {incremental:>10.3f} {full / incremental:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
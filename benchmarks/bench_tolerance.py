@@ -0,0 +1,56 @@
+"""Exact against tolerant placement matching in get_difference_model.
+
+B nudges 5% of the parts of A by 0.0001 LDU, moves another 5% sideways by 10 LDU and lists them in a
+different order. Exact matching reports both as differences, the tolerant matching only the moved parts.
+Run from the repository root:
+    python -m benchmarks.bench_tolerance [line counts...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_matching import generate_placements, to_line, write_model
+from BrickDifference.modelFunctions import LdrawFileTree, get_difference_model
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+TOLERANCE = (0.01, 0.0001)
+
+
+def run(sizes):
+    rng = random.Random(42)
+    print(f"{'lines':>10} {'exact s':>8} {'differences':>12} {'tolerant s':>11} {'differences':>12} {'us/line':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path_a = os.path.join(tmpdir, "a.ldr")
+        path_b = os.path.join(tmpdir, "b.ldr")
+        for size in sizes:
+            placements = generate_placements(size, rng)
+            lines_a = [to_line(*placement) for placement in placements]
+            lines_b = []
+            for colour, (x, y, z), part in placements:
+                chance = rng.random()
+                if chance < 0.05:
+                    x += 0.0001
+                elif chance < 0.1:
+                    x += 10
+                lines_b.append(to_line(colour, (x, y, z), part))
+            rng.shuffle(lines_b)
+            write_model(path_a, lines_a)
+            write_model(path_b, lines_b)
+            tree_a = LdrawFileTree(path_a)
+            tree_b = LdrawFileTree(path_b)
+            timings = []
+            for tolerance in (None, TOLERANCE):
+                start = time.perf_counter()
+                difference_model, _ = get_difference_model(tree_a, tree_b, tolerance=tolerance)
+                elapsed = time.perf_counter() - start
+                differences = sum(len(ld_file.content) for ld_file in difference_model.values())
+                timings.append((elapsed, differences))
+            (exact, exact_differences), (tolerant, tolerant_differences) = timings
+            print(f"{size:>10} {exact:>8.3f} {exact_differences:>12} {tolerant:>11.3f} {tolerant_differences:>12} "
+                  f"{tolerant / size * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,63 @@
+"""Speedup of get_difference_model with a process pool.
+
+Run from the repository root:
+    python -m benchmarks.bench_workers [submodel count] [parts per submodel]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from BrickDifference.modelFunctions import LdrawFileTree, get_difference_model
+from benchmarks.bench_matching import generate_placements, to_line
+
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+def write_model(filepath, submodels):
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.write("0 FILE main.ldr\n0 Untitled Model\n0 Name:  main.ldr\n0 Author: \n")
+        for index in range(len(submodels)):
+            file.write(f"1 0 0 {-index * 24} 0 1 0 0 0 1 0 0 0 1 sub_{index}.ldr\n")
+        file.write("0 NOFILE\n")
+        for index, placements in enumerate(submodels):
+            file.write(f"0 FILE sub_{index}.ldr\n0 sub_{index}\n0 Name:  sub_{index}.ldr\n0 Author: \n")
+            file.writelines(to_line(*placement) for placement in placements)
+            file.write("0 NOFILE\n")
+
+
+def run(submodel_count, part_count):
+    rng = random.Random(42)
+    submodels_a = [generate_placements(part_count, rng) for _ in range(submodel_count)]
+    # Every submodel of B moves 5% of its parts, so none of them can be skipped
+    submodels_b = []
+    for placements in submodels_a:
+        changed = []
+        for colour, (x, y, z), part in placements:
+            if rng.random() < 0.05:
+                x += 10
+            changed.append((colour, (x, y, z), part))
+        submodels_b.append(changed)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path_a = os.path.join(tmpdir, "a.ldr")
+        path_b = os.path.join(tmpdir, "b.ldr")
+        write_model(path_a, submodels_a)
+        write_model(path_b, submodels_b)
+        tree_a = LdrawFileTree(path_a)
+        tree_b = LdrawFileTree(path_b)
+    print(f"{submodel_count} submodels with {part_count} parts each, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        start = time.perf_counter()
+        get_difference_model(tree_a, tree_b, workers=workers)
+        elapsed = time.perf_counter() - start
+        if baseline is None:
+            baseline = elapsed
+        print(f"{workers:>8} {elapsed:>9.3f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    arguments = [int(arg) for arg in sys.argv[1:]]
+    run(*(arguments or [400, 2000]))
@@ -0,0 +1,80 @@
+"""Memory used to write all three difference models, on top of the parsed inputs.
+
+B starts as a copy of A with 5% of the parts moved, so most of every submodel is common.
+"inputs" is the memory held by both parsed trees, "streamed" the additional peak of
+generate_difference_files and "collected" the additional peak of building all three models
+as dicts before saving them.
+Run from the repository root:
+    python -m benchmarks.bench_write [line counts...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_parse import write_model
+from BrickDifference.modelFunctions import (
+    DIFF_MODEL_MODE,
+    LdrawFileTree,
+    generate_difference_files,
+    get_symmetric_difference_model,
+    save_model
+)
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def move_some_parts(filepath_a, filepath_b, rng):
+    with open(filepath_a, "r", encoding="utf-8") as file_a, open(filepath_b, "w", encoding="utf-8") as file_b:
+        for line in file_a:
+            if line.startswith("1 ") and line.rstrip().endswith(".dat") and rng.random() < 0.05:
+                parameters = line.split(" ")
+                parameters[2] = str(float(parameters[2]) + 10)
+                line = " ".join(parameters)
+            file_b.write(line)
+
+
+def measure(function):
+    # Additional peak memory in MiB and seconds
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    return (tracemalloc.get_traced_memory()[1] - before) / (1 << 20), elapsed
+
+
+def run(sizes):
+    rng = random.Random(42)
+    print(f"{'lines':>10} {'inputs MiB':>11} {'streamed MiB':>13} {'s':>7} {'collected MiB':>14} {'s':>7}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath_a = os.path.join(tmpdir, "a.ldr")
+        filepath_b = os.path.join(tmpdir, "b.ldr")
+        outputs = [os.path.join(tmpdir, f"out_{index}.ldr") for index in range(3)]
+        for size in sizes:
+            write_model(filepath_a, size, rng)
+            move_some_parts(filepath_a, filepath_b, rng)
+            tracemalloc.start()
+            tree_a = LdrawFileTree(filepath_a)
+            tree_b = LdrawFileTree(filepath_b)
+            inputs = tracemalloc.get_traced_memory()[0] / (1 << 20)
+
+            def streamed():
+                generate_difference_files(tree_a, tree_b, DIFF_MODEL_MODE, *outputs)
+
+            def collected():
+                models = get_symmetric_difference_model(tree_a, tree_b)
+                for model, filepath in zip(models, outputs):
+                    save_model(model, filepath)
+
+            streamed_peak, streamed_time = measure(streamed)
+            collected_peak, collected_time = measure(collected)
+            tracemalloc.stop()
+            print(f"{size:>10} {inputs:>11.1f} {streamed_peak:>13.1f} {streamed_time:>7.2f} {collected_peak:>14.1f} "
+                  f"{collected_time:>7.2f}")
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
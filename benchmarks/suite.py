@@ -0,0 +1,166 @@
+"""Benchmark suite over synthetic models with stored baselines to catch regressions.
+
+Every scenario writes a model pair with benchmarks.synthetic and measures, in a fresh interpreter:
+parse (both files), totals (both partlists), partlist_diff, model_diff (symmetric difference model)
+and save (all three difference models and partlists). Times are the best of REPEAT runs, memory is the
+tracemalloc peak of every stage in an extra run (deterministic, so a small tolerance is enough).
+Run from the repository root:
+    python -m benchmarks.suite [scenarios...] [--save-baseline PATH] [--compare PATH]
+With --compare the exit code is 1 if a stage got slower than --time-tolerance or used more memory
+than --memory-tolerance (relative to the baseline). Baselines only make sense on the same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import ModelSpec, write_pair
+
+SCENARIOS = {
+    "small": ModelSpec(parts=10_000),
+    "large": ModelSpec(parts=1_000_000, depth=2, fanout=16),
+    "flat": ModelSpec(parts=200_000, depth=0),
+    "deep": ModelSpec(parts=200_000, depth=6, fanout=3),
+    "reuse": ModelSpec(parts=200_000, depth=4, fanout=6, reuse=0.9),
+    "unique": ModelSpec(parts=200_000, unique_parts=20_000),
+    "rewrite": ModelSpec(parts=200_000, changes=60)
+}
+DEFAULT_SCENARIOS = ["small", "flat", "deep", "reuse", "unique", "rewrite", "large"]
+STAGES = ["parse", "totals", "partlist_diff", "model_diff", "save"]
+REPEAT = 3
+
+
+def run_stages(filepath_a, filepath_b, output_dir, measure):
+    # measure(stage, function) runs function and returns its result
+    from BrickDifference.modelFunctions import (
+        LdrawFileTree,
+        get_symmetric_difference_model,
+        get_symmetric_part_difference,
+        save_model
+    )
+
+    tree_a, tree_b = measure("parse", lambda: (LdrawFileTree(filepath_a), LdrawFileTree(filepath_b)))
+    partlist_a, partlist_b = measure("totals", lambda: (tree_a.total_partlist(), tree_b.total_partlist()))
+    partlists = measure("partlist_diff", lambda: get_symmetric_part_difference(partlist_a, partlist_b))
+    models = measure("model_diff", lambda: get_symmetric_difference_model(tree_a, tree_b))
+
+    def save():
+        for index, (model, partlist) in enumerate(zip(models, partlists)):
+            save_model(model, os.path.join(output_dir, f"model_{index}.ldr"))
+            partlist.save_as_ldraw_file(os.path.join(output_dir, f"partlist_{index}.ldr"))
+
+    measure("save", save)
+
+
+def run_scenario(filepath_a, filepath_b, output_dir) -> dict:
+    results = {stage: {"seconds": float("inf"), "peak_mib": 0.0} for stage in STAGES}
+
+    def timed(stage, function):
+        start = time.perf_counter()
+        result = function()
+        results[stage]["seconds"] = min(results[stage]["seconds"], time.perf_counter() - start)
+        return result
+
+    def traced(stage, function):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        results[stage]["peak_mib"] = (tracemalloc.get_traced_memory()[1] - before) / (1 << 20)
+        return result
+
+    for _ in range(REPEAT):
+        run_stages(filepath_a, filepath_b, output_dir, timed)
+    tracemalloc.start()
+    run_stages(filepath_a, filepath_b, output_dir, traced)
+    tracemalloc.stop()
+    return results
+
+
+def measure_scenario(name: str, tmpdir: str) -> dict:
+    spec = SCENARIOS[name]
+    filepath_a = os.path.join(tmpdir, f"{name}_a.ldr")
+    filepath_b = os.path.join(tmpdir, f"{name}_b.ldr")
+    statistics = write_pair(spec, filepath_a, filepath_b)
+    output = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--run", filepath_a, filepath_b, tmpdir],
+                            check=True, capture_output=True, text=True).stdout
+    stages = json.loads(output)
+    stages["parse"]["lines_per_second"] = (statistics["lines_a"] + statistics["lines_b"]) / stages["parse"]["seconds"]
+    return {"spec": spec.as_dict(), "statistics": statistics, "stages": stages}
+
+
+def find_regressions(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list:
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            continue
+        old_scenario = baseline["scenarios"][name]
+        if old_scenario["spec"] != scenario["spec"]:
+            regressions.append(f"{name}: the scenario changed since the baseline, save a new one")
+            continue
+        for stage, values in scenario["stages"].items():
+            old_values = old_scenario["stages"][stage]
+            for key, tolerance, unit in (("seconds", time_tolerance, "s"), ("peak_mib", memory_tolerance, "MiB")):
+                # Changes below 10 milliseconds or 0.1 MiB are noise
+                limit = max(old_values[key] * (1 + tolerance), old_values[key] + (0.01 if unit == "s" else 0.1))
+                if values[key] > limit:
+                    regressions.append(f"{name} {stage}: {values[key]:.3f} {unit} "
+                                       f"(baseline {old_values[key]:.3f} {unit})")
+    return regressions
+
+
+def print_results(results: dict):
+    print(f"{'scenario':>9} {'stage':>14} {'seconds':>9} {'peak MiB':>9}")
+    for name, scenario in results["scenarios"].items():
+        for stage, values in scenario["stages"].items():
+            print(f"{name:>9} {stage:>14} {values['seconds']:>9.3f} {values['peak_mib']:>9.1f}")
+        print(f"{name:>9} {'parse lines/s':>14} {scenario['stages']['parse']['lines_per_second']:>9.0f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"scenarios to run (default: all of {', '.join(DEFAULT_SCENARIOS)})")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store the results as baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results with a stored baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown of a stage (default: 0.25)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.05,
+                        help="allowed relative growth of the peak memory of a stage (default: 0.05)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if len(unknown) > 0:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": {}
+    }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in args.scenarios or DEFAULT_SCENARIOS:
+            results["scenarios"][name] = measure_scenario(name, tmpdir)
+    print_results(results)
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if args.compare is None:
+        return 0
+    with open(args.compare, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    if (baseline["python"], baseline["platform"]) != (results["python"], results["platform"]):
+        print("The baseline was measured with another Python version or platform", file=sys.stderr)
+    regressions = find_regressions(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--run":
+        print(json.dumps(run_scenario(*sys.argv[2:])))
+    else:
+        sys.exit(main())
@@ -0,0 +1,145 @@
+"""Deterministic generator for synthetic LDraw models and a changed copy of them.
+
+The main model references FANOUT submodels, which reference FANOUT submodels each, DEPTH levels deep.
+The lowest level holds the parts. REUSE is the fraction of references that point to a submodel that is
+already used elsewhere on the same level (0: every reference has its own submodel, 1: one submodel per level).
+B is A with CHANGES percent of the part lines moved, recoloured, replaced by another part, removed
+or followed by an added part. The same settings and seed always produce the same bytes.
+Run from the repository root to write a pair:
+    python -m benchmarks.synthetic A.ldr B.ldr [--parts N] [--unique-parts N] [--depth N] [--fanout N]
+                                   [--reuse FRACTION] [--changes PERCENT] [--seed N]
+"""
+import argparse
+import os
+import random
+
+COLOURS = [0, 1, 2, 4, 14, 15, 19, 25, 71, 72]
+IDENTITY = "1 0 0 0 1 0 0 0 1"
+ROTATED = "0 0 1 0 1 0 -1 0 0"
+GRID_SIZE = 50
+
+
+class ModelSpec:
+    def __init__(self, parts=10_000, unique_parts=50, depth=2, fanout=4, reuse=0.0, changes=5.0, seed=42):
+        if parts < 0 or unique_parts < 1 or depth < 0 or fanout < 1:
+            raise ValueError("parts and depth can not be negative, unique_parts and fanout need to be at least 1")
+        if not 0 <= reuse <= 1 or not 0 <= changes <= 100:
+            raise ValueError("reuse has to be between 0 and 1 and changes between 0 and 100")
+        self.parts = parts
+        self.unique_parts = unique_parts
+        self.depth = depth
+        self.fanout = fanout
+        self.reuse = reuse
+        self.changes = changes
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    def get_levels(self) -> list:
+        # Number of distinct files on every level, the main model is level 0
+        levels = [1]
+        for _ in range(self.depth):
+            references = levels[-1] * self.fanout
+            levels.append(max(1, round(references * (1 - self.reuse))))
+        return levels
+
+
+def get_filename(level: int, index: int) -> str:
+    if level == 0:
+        return "main.ldr"
+    return f"level{level}_{index}.ldr"
+
+
+def get_header(filename: str) -> str:
+    return f"0 FILE {filename}\n0 {filename[:-4]}\n0 Name:  {filename}\n0 Author: \n"
+
+
+def get_part_line(colour, index: int, rotation: str, part: str) -> str:
+    # Every index of a file has its own position
+    x = index % GRID_SIZE * 20
+    y = -(index // (GRID_SIZE * GRID_SIZE)) * 24
+    z = index // GRID_SIZE % GRID_SIZE * 20
+    return f"1 {colour} {x} {y} {z} {rotation} {part}\n"
+
+
+def write_pair(spec: ModelSpec, filepath_a: str, filepath_b: str = None) -> dict:
+    # Writes A and, if a path is given, B. Returns counts of what was written (B is also counted without a path).
+    rng = random.Random(spec.seed)
+    change_rng = random.Random(spec.seed + 1)
+    part_names = [f"{3001 + index}.dat" for index in range(spec.unique_parts)]
+    levels = spec.get_levels()
+    leaves = levels[-1]
+    statistics = {"files": sum(levels), "part_lines": 0, "changed": 0, "lines_a": 0, "lines_b": 0}
+    with (open(filepath_a, "w", encoding="utf-8") as file_a,
+          open(os.devnull if filepath_b is None else filepath_b, "w", encoding="utf-8") as file_b):
+        def write(line_a, line_b):
+            for line, file, key in ((line_a, file_a, "lines_a"), (line_b, file_b, "lines_b")):
+                if line is not None:
+                    file.write(line)
+                    statistics[key] += line.count("\n")
+
+        for level, count in enumerate(levels):
+            for index in range(count):
+                header = get_header(get_filename(level, index))
+                write(header, header)
+                if level < len(levels) - 1:
+                    for reference in range(spec.fanout):
+                        child = (index * spec.fanout + reference) % levels[level + 1]
+                        rotation = ROTATED if reference % 2 else IDENTITY
+                        line = f"1 16 {reference * 400} {-level * 24} 0 {rotation} {get_filename(level + 1, child)}\n"
+                        write(line, line)
+                else:
+                    part_count = spec.parts // leaves + (index < spec.parts % leaves)
+                    for part_index in range(part_count):
+                        colour = rng.choice(COLOURS)
+                        rotation = ROTATED if rng.random() < 0.25 else IDENTITY
+                        part = rng.choice(part_names)
+                        line_a = line_b = get_part_line(colour, part_index, rotation, part)
+                        statistics["part_lines"] += 1
+                        if change_rng.random() * 100 < spec.changes:
+                            statistics["changed"] += 1
+                            line_b = get_changed_line(change_rng, colour, part_index, rotation, part, part_names)
+                        write(line_a, line_b)
+                write("0 NOFILE\n", "0 NOFILE\n")
+    return statistics
+
+
+def get_changed_line(rng: random.Random, colour, index: int, rotation: str, part: str, part_names: list):
+    change = rng.randrange(5)
+    if change == 0:
+        # Moved above everything else of the file
+        line = get_part_line(colour, index, rotation, part).split(" ")
+        line[3] = str(int(line[3]) - 10_000)
+        return " ".join(line)
+    if change == 1:
+        return get_part_line(rng.choice([other for other in COLOURS if other != colour]), index, rotation, part)
+    if change == 2:
+        return get_part_line(colour, index, rotation, rng.choice(part_names))
+    if change == 3:
+        return None
+    added = get_part_line(colour, index, rotation, part).split(" ")
+    added[3] = str(int(added[3]) - 20_000)
+    return get_part_line(colour, index, rotation, part) + " ".join(added)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.synthetic",
+                                     description="Writes a synthetic LDraw model A and a changed copy B.")
+    parser.add_argument("file_a")
+    parser.add_argument("file_b", nargs="?")
+    defaults = ModelSpec()
+    parser.add_argument("--parts", type=int, default=defaults.parts)
+    parser.add_argument("--unique-parts", type=int, default=defaults.unique_parts)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--reuse", type=float, default=defaults.reuse)
+    parser.add_argument("--changes", type=float, default=defaults.changes)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args(argv)
+    spec = ModelSpec(args.parts, args.unique_parts, args.depth, args.fanout, args.reuse, args.changes, args.seed)
+    print(write_pair(spec, args.file_a, args.file_b))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,9 @@ setup(
     entry_points={
         'gui_scripts': [
             'BrickDifference = BrickDifference.app:run',
+        ],
+        'console_scripts': [
+            'brickdifference-cli = BrickDifference.cli:run',
         ]
     },
 
@@ -0,0 +1,52 @@
+from BrickDifference.modelFunctions import LdrawFileTree, get_flat_difference_model
+
+IDENTITY = "1 0 0 0 1 0 0 0 1"
+# 90 degrees around the y axis
+ROTATION = "0 0 1 0 1 0 -1 0 0"
+
+
+def write_files(filepath, files: dict) -> str:
+    with open(filepath, "w", encoding="utf-8") as file:
+        for filename, lines in files.items():
+            file.writelines(f"{line}\n" for line in [f"0 FILE {filename}", f"0 {filename}", *lines, "0 NOFILE"])
+    return str(filepath)
+
+
+def get_lines(content) -> list:
+    return sorted(line.strip() for line in content.get_lines())
+
+
+def test_transforms_and_colours_are_composed_along_the_references(tmp_path):
+    filepath = write_files(tmp_path / "a.ldr", {
+        "main.ldr": [f"1 2 100 0 0 {ROTATION} Mid.ldr", f"1 16 0 -8 0 {IDENTITY} leaf.ldr"],
+        "mid.ldr": [f"1 16 0 -24 0 {IDENTITY} leaf.ldr", f"1 4 0 0 0 {IDENTITY} 3001.dat"],
+        "leaf.ldr": [f"1 16 10 0 0 {IDENTITY} 3004.dat", f"1 1 0 0 20 {ROTATION} 3004.dat"]
+    })
+    tree = LdrawFileTree(filepath)
+    assert get_lines(tree.get_flat_content()) == sorted([
+        # leaf.ldr placed in mid.ldr placed in main.ldr, the main colour 16 becomes 2
+        f"1 2 100 -24 -10 {ROTATION} 3004.dat", "1 1 120 -24 0 -1 0 0 0 1 0 0 0 -1 3004.dat",
+        f"1 4 100 0 0 {ROTATION} 3001.dat",
+        # leaf.ldr placed directly, 16 stays the main colour
+        f"1 16 10 -8 0 {IDENTITY} 3004.dat", f"1 1 0 -8 20 {ROTATION} 3004.dat"
+    ])
+    # Every file is flattened in its own coordinates once
+    assert get_lines(tree.get_flat_content("leaf.ldr")) == sorted([f"1 16 10 0 0 {IDENTITY} 3004.dat",
+                                                                   f"1 1 0 0 20 {ROTATION} 3004.dat"])
+
+
+def test_restructured_models_only_differ_by_moved_parts(tmp_path):
+    filepath_a = write_files(tmp_path / "a.ldr", {
+        "main.ldr": [f"1 16 100 0 0 {IDENTITY} sub.ldr", f"1 4 0 0 0 {IDENTITY} 3001.dat"],
+        "sub.ldr": [f"1 15 0 0 0 {IDENTITY} 3004.dat", f"1 14 20 0 0 {IDENTITY} 3004.dat"]
+    })
+    # The submodel is renamed and moved, its content moved back, one part really moved
+    filepath_b = write_files(tmp_path / "b.ldr", {
+        "main.ldr": [f"1 16 50 0 0 {IDENTITY} renamed.ldr", f"1 4 0 0 0 {IDENTITY} 3001.dat"],
+        "renamed.ldr": [f"1 15 50 0 0 {IDENTITY} 3004.dat", f"1 14 70 -24 0 {IDENTITY} 3004.dat"]
+    })
+    only_a, only_b, a_and_b = get_flat_difference_model(LdrawFileTree(filepath_a), LdrawFileTree(filepath_b), True)
+    assert get_lines(only_a["main.ldr"].content) == [f"1 14 120 0 0 {IDENTITY} 3004.dat"]
+    assert get_lines(only_b["main.ldr"].content) == [f"1 14 120 -24 0 {IDENTITY} 3004.dat"]
+    assert get_lines(a_and_b["main.ldr"].content) == sorted([f"1 4 0 0 0 {IDENTITY} 3001.dat",
+                                                             f"1 15 100 0 0 {IDENTITY} 3004.dat"])
@@ -0,0 +1,54 @@
+import os
+
+from BrickDifference.library import LDrawLibrary
+from BrickDifference.modelFunctions import LdrawFileTree, get_symmetric_difference_model
+
+IDENTITY = "1 0 0 0 1 0 0 0 1"
+
+
+def write_lines(filepath, lines: list) -> str:
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.writelines(f"{line}\n" for line in lines)
+    return str(filepath)
+
+
+def make_library(tmp_path) -> str:
+    # Wheel.ldr in the models folder, it uses a submodel of its own and a part
+    library = tmp_path / "LDraw"
+    write_lines(library / "models" / "Wheel.ldr", ["0 FILE Wheel.ldr", "0 Wheel", f"1 16 0 0 0 {IDENTITY} Rim.ldr",
+                                                   f"1 0 0 0 0 {IDENTITY} 3641.dat", "0 NOFILE",
+                                                   "0 FILE rim.ldr", "0 Rim", f"1 16 0 0 0 {IDENTITY} 4624.dat",
+                                                   "0 NOFILE"])
+    write_lines(library / "parts" / "3001.dat", ["0 Brick 2 x 4", f"1 16 0 0 0 {IDENTITY} stud.dat"])
+    return str(library)
+
+
+def test_references_are_linked_case_insensitively(tmp_path):
+    library = LDrawLibrary(make_library(tmp_path))
+    filepath = write_lines(tmp_path / "car.ldr", [
+        "0 FILE car.ldr", "0 Car", f"1 16 0 0 0 {IDENTITY} AXLE.LDR", f"1 4 0 -24 0 {IDENTITY} 3001.dat", "0 NOFILE",
+        "0 FILE axle.ldr", "0 Axle", f"1 16 40 0 0 {IDENTITY} WHEEL.ldr", f"1 16 -40 0 0 {IDENTITY} wheel.LDR",
+        "0 NOFILE"
+    ])
+    for options in ({}, {"lazy": True}, {"use_mmap": True}):
+        tree = LdrawFileTree(filepath, library=library, **options)
+        assert tree.total_partlist().partlist == {"4:3001.dat": 1, "0:3641.dat": 2, "16:4624.dat": 2}
+        assert tree.external_ids == {"wheel.ldr", "rim.ldr"}
+        only_a, only_b, a_and_b = get_symmetric_difference_model(tree, LdrawFileTree(filepath, library=library))
+        assert only_a == {} and only_b == {} and list(a_and_b) == ["car.ldr", "axle.ldr"]
+
+
+def test_index_is_not_written_into_the_library(tmp_path):
+    directory = make_library(tmp_path)
+    library = LDrawLibrary(directory)
+    # Parts are never loaded from the library, so they are not indexed either
+    assert library.files == {"wheel.ldr": os.path.join("models", "Wheel.ldr")}
+    assert sorted(os.listdir(directory)) == ["models", "parts"]
+
+    index_path = str(tmp_path / "cache" / "library_index.json")
+    os.makedirs(os.path.dirname(index_path))
+    LDrawLibrary(directory, index_path)
+    assert os.path.isfile(index_path)
+    assert LDrawLibrary(directory, index_path).load_index()
+    assert sorted(os.listdir(directory)) == ["models", "parts"]
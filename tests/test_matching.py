@@ -0,0 +1,110 @@
+from BrickDifference.modelFunctions import (
+    DiffSession,
+    LdrawFileTree,
+    get_symmetric_difference_model
+)
+
+IDENTITY = "1 0 0 0 1 0 0 0 1"
+# Main model with three submodels, sub1.ldr and sub3.ldr both use leaf.ldr
+MODEL_A = {
+    "main.ldr": [f"1 16 0 0 0 {IDENTITY} sub1.ldr", f"1 16 100 0 0 {IDENTITY} sub2.ldr",
+                 f"1 16 200 0 0 {IDENTITY} sub3.ldr", f"1 4 0 -24 0 {IDENTITY} 3001.dat"],
+    "sub1.ldr": [f"1 16 0 0 0 {IDENTITY} leaf.ldr", f"1 1 0 0 40 {IDENTITY} 3001.dat"],
+    "sub2.ldr": [f"1 2 0 0 0 {IDENTITY} 3002.dat", f"1 2 20 0 0 {IDENTITY} 3002.dat"],
+    "sub3.ldr": [f"1 16 0 0 0 {IDENTITY} leaf.ldr", f"1 14 0 0 40 {IDENTITY} 3003.dat"],
+    "leaf.ldr": [f"1 15 0 0 0 {IDENTITY} 3004.dat", f"1 15 20 0 0 {IDENTITY} 3004.dat"]
+}
+# leaf.ldr changed and was moved in sub1.ldr and sub3.ldr, so both get a renamed copy of it
+MODEL_B = {
+    **MODEL_A,
+    "sub1.ldr": [f"1 16 10 0 0 {IDENTITY} leaf.ldr", f"1 1 0 0 40 {IDENTITY} 3001.dat"],
+    "sub3.ldr": [f"1 16 20 0 0 {IDENTITY} leaf.ldr", f"1 14 0 0 40 {IDENTITY} 3003.dat"],
+    "leaf.ldr": [f"1 15 0 0 0 {IDENTITY} 3004.dat", f"1 15 20 -24 0 {IDENTITY} 3004.dat"]
+}
+
+
+def write_model(filepath, files: dict) -> str:
+    with open(filepath, "w", encoding="utf-8") as file:
+        for filename, lines in files.items():
+            file.write(f"0 FILE {filename}\n0 {filename}\n")
+            file.writelines(f"{line}\n" for line in lines)
+            file.write("0 NOFILE\n")
+    return str(filepath)
+
+
+def get_lines(models) -> list:
+    # (only A, only B, A and B) as plain lines of every file
+    return [{file_id: ld_file.get_ldraw_lines() for file_id, ld_file in model.items()} for model in models]
+
+
+def get_content(model: dict, file_id: str = "main.ldr") -> list:
+    if file_id not in model:
+        return []
+    return sorted(line.strip() for line in model[file_id].content.get_lines())
+
+
+def get_fresh_difference(filepath_a: str, filepath_b: str) -> list:
+    return get_lines(get_symmetric_difference_model(LdrawFileTree(filepath_a), LdrawFileTree(filepath_b)))
+
+
+def test_duplicates_are_matched_once_each(tmp_path):
+    part = f"1 4 0 0 0 {IDENTITY} 3001.dat"
+    other = f"1 1 20 0 0 {IDENTITY} 3001.dat"
+    filepath_a = write_model(tmp_path / "a.ldr", {"main.ldr": [part, part, part, other]})
+    filepath_b = write_model(tmp_path / "b.ldr", {"main.ldr": [part, other, part]})
+    only_a, only_b, a_and_b = get_symmetric_difference_model(LdrawFileTree(filepath_a), LdrawFileTree(filepath_b))
+    assert get_content(only_a) == [part]
+    assert get_content(only_b) == []
+    assert get_content(a_and_b) == sorted([part, part, other])
+    only_b, only_a, a_and_b = get_symmetric_difference_model(LdrawFileTree(filepath_b), LdrawFileTree(filepath_a))
+    assert get_content(only_a) == [part]
+    assert get_content(only_b) == []
+
+
+def test_tolerance_matches_nearby_placements_only(tmp_path):
+    filepath_a = write_model(tmp_path / "a.ldr", {"main.ldr": [
+        f"1 4 0 0 0 {IDENTITY} 3001.dat", f"1 4 1 0 0 {IDENTITY} 3001.dat",
+        f"1 4 100 0 0 {IDENTITY} 3001.dat", f"1 2 200 0 0 {IDENTITY} 3001.dat"
+    ]})
+    filepath_b = write_model(tmp_path / "b.ldr", {"main.ldr": [
+        # Each placement of A takes the nearest free one
+        f"1 4 1.1 0 0 {IDENTITY} 3001.dat", "1 4 0.2 0 0 0.999 0 0 0 1 0 0 0 1 3001.dat",
+        # Too far away, another colour or another part
+        f"1 4 103 0 0 {IDENTITY} 3001.dat", f"1 1 200 0 0 {IDENTITY} 3001.dat", f"1 4 300 0 0 {IDENTITY} 3002.dat"
+    ]})
+    model_a, model_b = LdrawFileTree(filepath_a), LdrawFileTree(filepath_b)
+    only_a, only_b, a_and_b = get_symmetric_difference_model(model_a, model_b, tolerance=(0.5, 0.01))
+    assert get_content(only_a) == sorted([f"1 4 100 0 0 {IDENTITY} 3001.dat", f"1 2 200 0 0 {IDENTITY} 3001.dat"])
+    assert get_content(only_b) == sorted([f"1 4 103 0 0 {IDENTITY} 3001.dat", f"1 1 200 0 0 {IDENTITY} 3001.dat",
+                                          f"1 4 300 0 0 {IDENTITY} 3002.dat"])
+    assert get_content(a_and_b) == sorted([f"1 4 0 0 0 {IDENTITY} 3001.dat", f"1 4 1 0 0 {IDENTITY} 3001.dat"])
+    # The rotation of the second pair differs by 0.001
+    only_a, _, _ = get_symmetric_difference_model(model_a, model_b, tolerance=(0.5, 0.0001))
+    assert f"1 4 0 0 0 {IDENTITY} 3001.dat" in get_content(only_a)
+    only_a, _, _ = get_symmetric_difference_model(model_a, model_b)
+    assert len(get_content(only_a)) == 4
+
+
+def test_workers_give_the_same_result(tmp_path):
+    filepath_a = write_model(tmp_path / "a.ldr", MODEL_A)
+    filepath_b = write_model(tmp_path / "b.ldr", MODEL_B)
+    model_a, model_b = LdrawFileTree(filepath_a), LdrawFileTree(filepath_b)
+    result = get_lines(get_symmetric_difference_model(model_a, model_b, workers=1))
+    assert result == get_lines(get_symmetric_difference_model(model_a, model_b, workers=3))
+    only_a = result[0]
+    assert {"leaf.ldr_1", "leaf.ldr_2"} <= only_a.keys()
+
+
+def test_session_after_reload_equals_a_fresh_comparison(tmp_path):
+    filepath_a = write_model(tmp_path / "a.ldr", MODEL_A)
+    filepath_b = write_model(tmp_path / "b.ldr", MODEL_B)
+    session = DiffSession(filepath_a, filepath_b)
+    assert get_lines(session.get_symmetric_difference_model()) == get_fresh_difference(filepath_a, filepath_b)
+
+    write_model(filepath_b, {**MODEL_B, "sub2.ldr": [f"1 2 0 0 0 {IDENTITY} 3002.dat"]})
+    assert session.reload_b() == {"sub2.ldr"}
+    assert get_lines(session.get_symmetric_difference_model()) == get_fresh_difference(filepath_a, filepath_b)
+
+    write_model(filepath_a, {**MODEL_A, "leaf.ldr": MODEL_B["leaf.ldr"]})
+    assert session.reload_a() == {"leaf.ldr"}
+    assert get_lines(session.get_symmetric_difference_model()) == get_fresh_difference(filepath_a, filepath_b)
@@ -0,0 +1,63 @@
+import os
+
+from BrickDifference.modelFunctions import LdrawFileTree
+from BrickDifference.parsecache import ParseCache
+
+MODEL = ["0 FILE main.ldr", "0 main.ldr", "1 16 0 0 0 1 0 0 0 1 0 0 0 1 sub.ldr",
+         "1 4 0 -24 0 1 0 0 0 1 0 0 0 1 3001.dat", "0 NOFILE",
+         "0 FILE sub.ldr", "0 sub.ldr", "1 15 0 0 0 1 0 0 0 1 0 0 0 1 3004.dat", "0 NOFILE"]
+
+
+def write_model(filepath) -> str:
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.writelines(f"{line}\n" for line in MODEL)
+    return str(filepath)
+
+
+def get_entry_paths(cache: ParseCache) -> list:
+    return [path for _, _, path in cache.get_entries()]
+
+
+def test_second_parse_is_a_hit(tmp_path):
+    filepath = write_model(tmp_path / "model.ldr")
+    cache = ParseCache(str(tmp_path / "cache"))
+    tree = LdrawFileTree(filepath, cache=cache)
+    assert not tree.from_cache and (cache.hits, cache.misses) == (0, 1)
+    cached_tree = LdrawFileTree(filepath, cache=cache)
+    assert cached_tree.from_cache and (cache.hits, cache.misses) == (1, 1)
+    assert cached_tree.total_partlist().partlist == tree.total_partlist().partlist
+    assert cached_tree.filetree["main.ldr"].get_ldraw_lines() == tree.filetree["main.ldr"].get_ldraw_lines()
+
+
+def test_damaged_entry_is_a_miss_and_replaced(tmp_path):
+    filepath = write_model(tmp_path / "model.ldr")
+    cache = ParseCache(str(tmp_path / "cache"))
+    LdrawFileTree(filepath, cache=cache)
+    entry_path, = get_entry_paths(cache)
+    with open(entry_path, "wb") as file:
+        file.write(b"damaged")
+    tree = LdrawFileTree(filepath, cache=cache)
+    assert not tree.from_cache and cache.misses == 2
+    assert tree.total_partlist().partlist == {"4:3001.dat": 1, "15:3004.dat": 1}
+    assert LdrawFileTree(filepath, cache=cache).from_cache
+
+
+def test_entry_that_can_not_be_touched_or_removed_is_used(tmp_path, monkeypatch):
+    # Like an entry written by another user, reading works but its time and the directory can not be changed
+    filepath = write_model(tmp_path / "model.ldr")
+    cache = ParseCache(str(tmp_path / "cache"))
+    LdrawFileTree(filepath, cache=cache)
+
+    def deny(*args, **kwargs):
+        raise PermissionError("denied")
+
+    monkeypatch.setattr(os, "utime", deny)
+    monkeypatch.setattr(os, "remove", deny)
+    monkeypatch.setattr(os, "replace", deny)
+    assert LdrawFileTree(filepath, cache=cache).from_cache
+    entry_path, = get_entry_paths(cache)
+    with open(entry_path, "wb") as file:
+        file.write(b"damaged")
+    assert not LdrawFileTree(filepath, cache=cache).from_cache
+    cache.clear()
+    assert get_entry_paths(cache) == [entry_path]
@@ -0,0 +1,95 @@
+import pytest
+
+from BrickDifference.modelFunctions import (
+    LdrawFileTree,
+    get_flat_difference_model,
+    get_symmetric_difference_model,
+    save_model
+)
+
+IDENTITY = "1 0 0 0 1 0 0 0 1"
+
+
+def write_lines(filepath, lines: list) -> str:
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.writelines(f"{line}\n" for line in ["0 FILE main.ldr", "0 main.ldr", *lines, "0 NOFILE"])
+    return str(filepath)
+
+
+def test_short_type_1_line_raises_value_error(tmp_path):
+    filepath = write_lines(tmp_path / "short.ldr", [f"1 4 0 0 0 {IDENTITY} 3001.dat", "1 4 0 0 0 1 0 0 3001.dat"])
+    with pytest.raises(ValueError, match="1 4 0 0 0 1 0 0 3001.dat"):
+        LdrawFileTree(filepath)
+
+
+def test_invalid_number_raises_value_error_once_needed(tmp_path):
+    filepath = write_lines(tmp_path / "invalid.ldr", [f"1 4 0 0 0 {IDENTITY} 3001.dat",
+                                                      f"1 4 0 x 0 {IDENTITY} 3001.dat"])
+    # The partlist does not need the numbers
+    tree = LdrawFileTree(filepath)
+    assert tree.total_partlist().partlist == {"4:3001.dat": 2}
+    with pytest.raises(ValueError, match=f"1 4 0 x 0 {IDENTITY} 3001.dat"):
+        get_flat_difference_model(tree, tree)
+
+
+def test_placements_are_written_as_in_the_file(tmp_path):
+    lines = [f"1 4 0.50 -0 1e1 {IDENTITY} 3001.dat", "1 1 20 0 0 0 0 -1 0 1 0 1 0 0 Technic Axle.dat"]
+    filepath = write_lines(tmp_path / "a.ldr", lines)
+    only_a, _, _ = get_symmetric_difference_model(LdrawFileTree(filepath), LdrawFileTree(write_lines(
+        tmp_path / "b.ldr", [])))
+    save_model(only_a, tmp_path / "only_a.ldr")
+    with open(tmp_path / "only_a.ldr", encoding="utf-8") as file:
+        assert [line.rstrip("\n") for line in file if line.startswith("1")] == lines
+
+
+def test_placements_are_compared_by_value(tmp_path):
+    filepath_a = write_lines(tmp_path / "a.ldr", [f"1 4 0.50 0 0 {IDENTITY} 3001.dat"])
+    filepath_b = write_lines(tmp_path / "b.ldr", ["1 4 0.5 0 0 1.0 0 0 0 1 0 0 0 1 3001.dat"])
+    only_a, only_b, a_and_b = get_symmetric_difference_model(LdrawFileTree(filepath_a), LdrawFileTree(filepath_b))
+    assert only_a == {} and only_b == {}
+    assert len(a_and_b["main.ldr"].content) == 1
+
+
+def write_files(filepath, files: dict) -> str:
+    with open(filepath, "w", encoding="utf-8", newline="") as file:
+        for filename, lines in files.items():
+            file.writelines(f"{line}\r\n" for line in [f"0 FILE {filename}", f"0 {filename}", *lines, "0 NOFILE"])
+    return str(filepath)
+
+
+# unused.ldr is not referenced by the main model, crlf line ends like files saved on Windows
+FILES = {
+    "main.ldr": [f"1 16 0 0 0 {IDENTITY} Sub.ldr", f"1 16 0 -24 0 {IDENTITY} sub.ldr",
+                 f"1 4 0 0 0 {IDENTITY} 3001.dat"],
+    "sub.ldr": [f"1 1 0 0 0 {IDENTITY} 3004.dat", f"1 16 20 0 0 {IDENTITY} 3004.dat"],
+    "unused.ldr": [f"1 2 0 0 0 {IDENTITY} 3003.dat"]
+}
+
+
+def test_lazy_and_memory_mapped_trees_equal_the_text_tree(tmp_path):
+    filepath_a = write_files(tmp_path / "a.ldr", FILES)
+    filepath_b = write_files(tmp_path / "b.ldr", {**FILES, "sub.ldr": [f"1 1 0 0 0 {IDENTITY} 3004.dat"]})
+    results = []
+    for options in ({}, {"lazy": True}, {"use_mmap": True}):
+        tree_a, tree_b = LdrawFileTree(filepath_a, **options), LdrawFileTree(filepath_b, **options)
+        differences = get_symmetric_difference_model(tree_a, tree_b)
+        results.append((
+            list(tree_a.filetree), tree_a.line_count,
+            {file_id: tree_a.total_partlist(file_id).partlist for file_id in tree_a.filetree},
+            {file_id: ld_file.get_ldraw_lines() for file_id, ld_file in tree_a.filetree.items()},
+            [{file_id: ld_file.get_ldraw_lines() for file_id, ld_file in model.items()} for model in differences]
+        ))
+    assert results[0] == results[1] == results[2]
+
+
+def test_lazy_tree_keeps_no_file_content(tmp_path):
+    filepath = write_files(tmp_path / "a.ldr", FILES)
+    tree = LdrawFileTree(filepath, lazy=True)
+    assert tree.buffer is None
+    assert tree.total_partlist().partlist == {"1:3004.dat": 2, "16:3004.dat": 2, "4:3001.dat": 1}
+    assert tree.get_load_statistics()["unparsed_ids"] == ["unused.ldr"]
+    # The unparsed file is read from the file again, which must still be the indexed one
+    with open(filepath, "a", encoding="utf-8") as file:
+        file.write("0 FILE later.ldr\n0 NOFILE\n")
+    with pytest.raises(ValueError, match="changed"):
+        tree.filetree["unused.ldr"]
@@ -0,0 +1,53 @@
+import csv
+import json
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+from BrickDifference.modelFunctions import Partlist
+
+# 71 (Light Bluish Gray) has a BrickLink colour, 16 (main colour) and the direct colour do not
+PARTLIST = Partlist({"71:3069b.dat": 2, "4:3001.dat": 3, "1:3001.dat": 1, "16:parts/s/custom & co.dat": 1,
+                     "0x2FF0000:3001.dat": 4})
+# Names without a part number and direct colours come first
+ROWS = [("16", "parts/s/custom & co.dat", 1), ("0x2FF0000", "3001.dat", 4), ("1", "3001.dat", 1), ("4", "3001.dat", 3),
+        ("71", "3069b.dat", 2)]
+
+
+def test_rows_are_ordered_by_part_and_colour_number():
+    assert list(PARTLIST.iter_rows()) == ROWS
+
+
+def test_csv(tmp_path):
+    PARTLIST.save_as_file(tmp_path / "parts.csv")
+    with open(tmp_path / "parts.csv", encoding="utf-8", newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows == [["colour", "part", "quantity"]] + [[colour, part, str(amount)] for colour, part, amount in ROWS]
+
+
+def test_json(tmp_path):
+    PARTLIST.save_as_file(tmp_path / "parts.json")
+    with open(tmp_path / "parts.json", encoding="utf-8") as file:
+        entries = json.load(file)
+    assert entries == [{"colour": colour, "part": part, "quantity": amount} for colour, part, amount in ROWS]
+
+
+def test_bricklink_wanted_list(tmp_path):
+    PARTLIST.save_as_file(tmp_path / "wanted.xml")
+    items = ElementTree.parse(tmp_path / "wanted.xml").getroot().findall("ITEM")
+    assert [(item.findtext("ITEMID"), item.findtext("COLOR"), item.findtext("REMARKS"), item.findtext("MINQTY"))
+            for item in items] == [
+        ("custom & co", None, "LDraw colour 16", "1"), ("3001", None, "LDraw colour 0x2FF0000", "4"),
+        ("3001", "7", None, "1"), ("3001", "5", None, "3"), ("3069b", "86", None, "2")
+    ]
+
+
+def test_format_overrides_the_extension(tmp_path):
+    PARTLIST.save_as_file(tmp_path / "parts.txt", "json")
+    with open(tmp_path / "parts.txt", encoding="utf-8") as file:
+        assert len(json.load(file)) == len(ROWS)
+    PARTLIST.save_as_file(tmp_path / "parts.ldr")
+    with open(tmp_path / "parts.ldr", encoding="utf-8") as file:
+        assert file.readline() == "0 FILE parts.ldr\n"
+    with pytest.raises(ValueError):
+        PARTLIST.save_as_file(tmp_path / "parts.ldr", "pdf")
@@ -0,0 +1,36 @@
+from BrickDifference.modelFunctions import PartMatrix, Partlist, get_symmetric_part_difference
+
+PARTLIST_A = {"4:3001.dat": 3, "1:3001.dat": 1, "15:3004.dat": 2}
+PARTLIST_B = {"4:3001.dat": 1, "15:3004.dat": 2, "14:3003.dat": 5}
+
+
+def test_symmetric_part_difference():
+    only_a, only_b, a_and_b = get_symmetric_part_difference(Partlist(PARTLIST_A), Partlist(PARTLIST_B))
+    assert only_a.partlist == {"4:3001.dat": 2, "1:3001.dat": 1}
+    assert only_b.partlist == {"14:3003.dat": 5}
+    assert a_and_b.partlist == {"4:3001.dat": 1, "15:3004.dat": 2}
+
+
+def test_pairwise_operations_equal_the_matrix():
+    partlists = [Partlist(PARTLIST_A), Partlist(PARTLIST_B), Partlist()]
+    matrix = PartMatrix(partlists)
+    for (model_a, model_b), difference in matrix.get_pairwise_differences().items():
+        assert difference.partlist == partlists[model_a].get_difference(partlists[model_b]).partlist
+    assert matrix.get_intersection().partlist == partlists[0].get_common(partlists[1]).get_common(partlists[2]).partlist
+
+
+def test_compact_model_has_one_line_per_part_and_colour():
+    partlist = Partlist(PARTLIST_A)
+    lines = partlist.generate_ldraw_model("parts.ldr", 100, 50, 10)
+    compact_lines = partlist.generate_ldraw_model("parts.ldr", 100, 50, 10, compact=True)
+    assert "0 NumOfBricks:  6\n" in lines and "0 NumOfBricks:  3\n" in compact_lines
+    placements = [line for line in lines if line.startswith("1 ")]
+    compact_placements = [line for line in compact_lines if line.startswith("1 ")]
+    # Every compact line is the lowest part of its stack in the full model, preceded by its quantity
+    assert compact_placements == [line for line in placements if line.split()[3] == "0"]
+    assert [line for line in compact_lines if line.startswith("0 // Quantity")] == [
+        f"0 // Quantity: {amount}\n" for amount in PARTLIST_A.values()
+    ]
+    for index, line in enumerate(compact_lines):
+        if line.startswith("1 "):
+            assert compact_lines[index - 1].startswith("0 // Quantity")
@@ -0,0 +1,98 @@
+import pytest
+
+from BrickDifference.modelFunctions import (
+    DIFF_MODEL_MODE,
+    DiffSession,
+    LdrawFileTree,
+    OperationCancelled,
+    generate_difference_files
+)
+
+IDENTITY = "1 0 0 0 1 0 0 0 1"
+SUBMODEL_COUNT = 5
+FILE_IDS = ["main.ldr"] + [f"sub{index}.ldr" for index in range(SUBMODEL_COUNT)]
+
+
+def write_model(filepath, offset: int) -> str:
+    # Main model with SUBMODEL_COUNT submodels, offset moves a part in every submodel
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.write("0 FILE main.ldr\n0 main.ldr\n")
+        file.writelines(f"1 16 0 {-24 * index} 0 {IDENTITY} sub{index}.ldr\n" for index in range(SUBMODEL_COUNT))
+        file.write("0 NOFILE\n")
+        for index in range(SUBMODEL_COUNT):
+            file.write(f"0 FILE sub{index}.ldr\n0 sub{index}.ldr\n1 4 {offset} 0 0 {IDENTITY} 3001.dat\n0 NOFILE\n")
+    return str(filepath)
+
+
+def test_model_mode_reports_every_written_file(tmp_path):
+    filetree_a = LdrawFileTree(write_model(tmp_path / "a.ldr", 0), lazy=True)
+    filetree_b = LdrawFileTree(write_model(tmp_path / "b.ldr", 20), lazy=True)
+    reports = []
+    generate_difference_files(filetree_a, filetree_b, DIFF_MODEL_MODE, str(tmp_path / "a_and_b.ldr"),
+                              str(tmp_path / "only_a.ldr"), str(tmp_path / "only_b.ldr"),
+                              progress=lambda *report: reports.append(report))
+    fractions = [done / total for done, total, _ in reports]
+    assert fractions == sorted(fractions) and fractions[-1] == 1
+    # Both models are walked through file by file
+    assert len([message for _, _, message in reports if message.endswith(".ldr")]) == 2 * (SUBMODEL_COUNT + 1)
+    assert reports[-1][2] == "Done"
+
+
+def test_model_mode_stops_while_writing(tmp_path):
+    filetree_a = LdrawFileTree(write_model(tmp_path / "a.ldr", 0), lazy=True)
+    filetree_b = LdrawFileTree(write_model(tmp_path / "b.ldr", 20), lazy=True)
+    reports = []
+
+    def progress(done_steps, total_steps, message):
+        reports.append(message)
+        if message == "Writing sub2.ldr":
+            raise OperationCancelled
+
+    with pytest.raises(OperationCancelled):
+        generate_difference_files(filetree_a, filetree_b, DIFF_MODEL_MODE, None, str(tmp_path / "only_a.ldr"),
+                                  progress=progress)
+    assert "Done" not in reports and "Writing sub3.ldr" not in reports
+
+
+def test_reading_reports_every_file_and_can_be_cancelled(tmp_path):
+    filepath = write_model(tmp_path / "a.ldr", 0)
+    reports = []
+    LdrawFileTree(filepath, progress=lambda *report: reports.append(report))
+    assert [file_id for _, _, file_id in reports] == FILE_IDS
+    assert reports[-1][0] == reports[-1][1]
+
+    def cancel_at_sub2(parsed_bytes, total_bytes, file_id):
+        if file_id == "sub2.ldr":
+            raise OperationCancelled
+
+    with pytest.raises(OperationCancelled):
+        LdrawFileTree(filepath, progress=cancel_at_sub2)
+
+
+def test_lazy_parsing_can_be_cancelled_between_files(tmp_path):
+    filepath = write_model(tmp_path / "a.ldr", 0)
+    reports = []
+
+    def cancel_at_sub2(parsed_bytes, total_bytes, file_id):
+        reports.append(file_id)
+        if file_id == "sub2.ldr":
+            raise OperationCancelled
+
+    filetree = LdrawFileTree(filepath, lazy=True, progress=cancel_at_sub2)
+    with pytest.raises(OperationCancelled):
+        filetree.total_partlist()
+    assert reports == ["main.ldr", "sub0.ldr", "sub1.ldr", "sub2.ldr"]
+    assert not filetree.filetree.is_loaded("sub2.ldr")
+    # Still complete once the next generation replaced the progress
+    filetree.progress = None
+    assert filetree.total_partlist().partlist == {"4:3001.dat": SUBMODEL_COUNT}
+
+
+def test_session_reports_the_side_of_every_file(tmp_path):
+    reports = []
+    session = DiffSession(write_model(tmp_path / "a.ldr", 0), write_model(tmp_path / "b.ldr", 20),
+                          progress=lambda side, *report: reports.append((side, report[2])))
+    session.get_symmetric_difference_model()
+    assert sorted(reports) == sorted((side, file_id) for side in (0, 1) for file_id in FILE_IDS)
+    session.set_progress(None)
+    assert session.model_a.progress is None and session.model_b.progress is None
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from BrickDifference.service import DiffService, TreeCache
+
+IDENTITY = "1 0 0 0 1 0 0 0 1"
+
+
+def write_model(filepath, lines: list) -> str:
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.writelines(f"{line}\n" for line in ["0 FILE main.ldr", "0 main.ldr", *lines, "0 NOFILE"])
+    return str(filepath)
+
+
+def request(service: DiffService, method: str, path: str, job) -> tuple:
+    body = json.dumps(job).encode("utf-8") if not isinstance(job, bytes) else job
+    return asyncio.run(service.handle_request(method, path, body))
+
+
+def test_partlist_job_without_outputs_returns_the_partlists(tmp_path):
+    filepath_a = write_model(tmp_path / "a.ldr", [f"1 4 0 0 0 {IDENTITY} 3001.dat", f"1 4 0 -24 0 {IDENTITY} 3001.dat"])
+    filepath_b = write_model(tmp_path / "b.ldr", [f"1 4 0 0 0 {IDENTITY} 3001.dat", f"1 1 0 0 0 {IDENTITY} 3003.dat"])
+    service = DiffService(TreeCache(max_trees=2))
+    try:
+        status, response = request(service, "POST", "/partlist", {"a": filepath_a, "b": filepath_b})
+        assert status == 200
+        assert response == {"only_a": [["4", "3001.dat", 1]], "only_b": [["1", "3003.dat", 1]],
+                            "a_and_b": [["4", "3001.dat", 1]]}
+        request(service, "POST", "/partlist", {"a": filepath_a, "b": filepath_b})
+        assert request(service, "GET", "/status", b"")[1]["hits"] == 2
+    finally:
+        service.executor.shutdown()
+
+
+def test_errors_only_end_the_request(tmp_path, monkeypatch):
+    service = DiffService(TreeCache())
+    try:
+        assert request(service, "POST", "/partlist", b"{")[0] == 400
+        assert request(service, "POST", "/partlist", {"a": str(tmp_path / "missing.ldr")})[0] == 400
+        assert request(service, "GET", "/partlist", {})[0] == 405
+        assert request(service, "POST", "/unknown", {})[0] == 404
+
+        def fail(mode, job):
+            raise RuntimeError("unexpected")
+
+        monkeypatch.setattr(service, "run", fail)
+        assert request(service, "POST", "/model", {}) == (500, {"error": "RuntimeError: unexpected"})
+        monkeypatch.undo()
+        assert request(service, "GET", "/status", b"")[0] == 200
+    finally:
+        service.executor.shutdown()